@@ -14,7 +14,7 @@ import sys # For stderr
 import shutil # To check for command existence
 import threading # For monitoring thread
 import time
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Dict
 
 # --- *** إضافة: استيراد من PyQt لتسهيل الإشارات *** ---
 # هذا يضيف اعتمادية PyQt6 على هذا الملف، لكنه يبسط إرسال الإشارات
@@ -68,6 +68,7 @@ class XKBManager(QObject):
 
         self._method = self.METHOD_NONE
         self._available_layouts: List[str] = []
+        self._layout_index_map: Dict[str, int] = {} # Name -> index in _available_layouts (see index_of)
         self._current_layout_index: int = -1
         self._monitor_thread: Optional[threading.Thread] = None
         self._monitor_process: Optional[subprocess.Popen] = None
@@ -115,7 +116,7 @@ class XKBManager(QObject):
             print("xkb-switch initialization failed: command error.")
             return False
 
-        self._available_layouts = [line for line in layouts_output.splitlines() if line.strip()]
+        self._set_available_layouts([line for line in layouts_output.splitlines() if line.strip()])
         if not self._available_layouts:
             print("xkb-switch initialization failed: no layouts returned by '-l'.")
             return False
@@ -147,11 +148,11 @@ class XKBManager(QObject):
 
         layout_match = re.search(r'layout:\s*([\w,]+)', query_output)
         if layout_match:
-            self._available_layouts = layout_match.group(1).split(',')
+            self._set_available_layouts(layout_match.group(1).split(','))
         else:
             print("setxkbmap initialization warning: Could not parse 'layout:' line. Assuming 'us'.", file=sys.stderr)
             # Fallback if layout line isn't present (might happen in minimal setups)
-            self._available_layouts = ['us'] # Default assumption
+            self._set_available_layouts(['us']) # Default assumption
 
         if not self._available_layouts:
              print("setxkbmap initialization failed: No layouts found in query.", file=sys.stderr)
@@ -249,7 +250,7 @@ class XKBManager(QObject):
         # --- Update internal state ---
         if set(new_layouts) != set(self._available_layouts):
             print(f"Available layout set updated: {self._available_layouts} -> {new_layouts}")
-            self._available_layouts = new_layouts
+            self._set_available_layouts(new_layouts)
             # Re-validate index after list change
             current_name = self.get_current_layout_name() # Get current name based on *internal* state
             if current_name and current_name in self._available_layouts:
@@ -302,6 +303,17 @@ class XKBManager(QObject):
         """Returns the cached list of available layout names."""
         return self._available_layouts
 
+    def _set_available_layouts(self, layouts: List[str]):
+        """Replaces the cached layout list and rebuilds its name -> index map."""
+        self._available_layouts = layouts
+        self._layout_index_map = {}
+        for i, name in enumerate(layouts):
+            self._layout_index_map.setdefault(name, i) # First occurrence wins, like list.index()
+
+    def index_of(self, name: Optional[str]) -> int:
+        """Returns the index of a layout name in the available list, or -1 if unknown."""
+        return self._layout_index_map.get(name, -1)
+
     def get_current_layout_index(self) -> int:
         """Returns the index the manager *believes* is currently active."""
         if not self._available_layouts: return -1
@@ -380,11 +392,11 @@ class XKBManager(QObject):
     def set_layout_by_name(self, name: str, update_system: bool = True) -> bool:
         """Attempts to set the active layout to the one matching the given name."""
         try:
-            index = self._available_layouts.index(name)
+            index = self.index_of(name)
+            if index < 0:
+                print(f"ERROR: Layout name '{name}' not found in available layouts: {self._available_layouts}", file=sys.stderr)
+                return False
             return self.set_layout_by_index(index, update_system=update_system)
-        except ValueError:
-            print(f"ERROR: Layout name '{name}' not found in available layouts: {self._available_layouts}", file=sys.stderr)
-            return False
         except Exception as e:
              print(f"ERROR finding index for layout name '{name}': {e}", file=sys.stderr)
              return False
@@ -504,23 +516,16 @@ class XKBManager(QObject):
                     if new_layout:
                         print(f"Monitor: Detected layout change -> {new_layout}")
                         # Update internal state and emit signal
-                        if new_layout in self._available_layouts:
-                            try:
-                                new_index = self._available_layouts.index(new_layout)
-                                self._set_internal_index(new_index, emit_signal=True)
-                            except ValueError:
-                                print(f"Monitor Warning: '{new_layout}' not in known layouts after change.", file=sys.stderr)
-                                # Optionally refresh the list if layout isn't known
-                                # self.refresh()
+                        new_index = self.index_of(new_layout)
+                        if new_index >= 0:
+                            self._set_internal_index(new_index, emit_signal=True)
                         else:
                              print(f"Monitor Warning: Received unknown layout '{new_layout}'. Refreshing list.", file=sys.stderr)
                              self.refresh() # Refresh list if layout is completely new
                              # Re-check and set index after refresh
-                             if new_layout in self._available_layouts:
-                                 try:
-                                     new_index = self._available_layouts.index(new_layout)
-                                     self._set_internal_index(new_index, emit_signal=True)
-                                 except ValueError: pass
+                             new_index = self.index_of(new_layout)
+                             if new_index >= 0:
+                                 self._set_internal_index(new_index, emit_signal=True)
 
 
                 # Check process exit status after loop ends
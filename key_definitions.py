@@ -7,6 +7,8 @@
 # Developed by Khaled Abdelhamid (khaled1512@gmail.com) - Licensed under GPLv3.
 # Defines keyboard layout, X11 keysym constants, and fallback character map.
 
+from types import MappingProxyType
+
 from .xlib_integration import XK
 
 # --- KeySym Definitions ---
@@ -82,4 +84,47 @@ KEYBOARD_LAYOUT = [
     [('L Ctrl', 1, 2), ('L Win', 1, 1), ('L Alt', 1, 1), ('Lang1', 1, 1), ('Space', 1, 5), ('Lang3', 1, 1), ('R Alt', 1, 1), ('R Win', 1, 1), ('App', 1, 1), ('R Ctrl', 1, 2), ('Left', 1, 1), ('Down', 1, 1), ('Right', 1, 1), ('Donate', 1, 1)] # Changed to Lang2, Lang3
 ]
 # --- *** نهاية التعديل *** ---
+
+# Keys that latch a modifier state and show the "modifier_on" visual
+MODIFIER_KEYS = frozenset({'LShift', 'RShift', 'L Ctrl', 'R Ctrl', 'L Alt', 'R Alt', 'Caps Lock'})
+SHIFT_KEYS = frozenset({'LShift', 'RShift'})
+CTRL_KEYS = frozenset({'L Ctrl', 'R Ctrl'})
+ALT_KEYS = frozenset({'L Alt', 'R Alt'})
+# Single-letter keys, whose case follows Shift XOR Caps Lock
+LETTER_KEYS = frozenset(k for k in X11_KEYSYM_MAP.keys() | FALLBACK_CHAR_MAP.keys() if len(k) == 1 and k.isalpha())
+
+# Sticky modifier state bits, packed into VirtualKeyboard._mod_state
+MOD_SHIFT = 1; MOD_CTRL = 2; MOD_ALT = 4; MOD_CAPS = 8
+MOD_CAPS_SHIFT = 3 # Shift distance from MOD_CAPS down to MOD_SHIFT (letter case = Shift XOR Caps)
+
+# --- Display labels for non-character keys (shared by UI init and label updates) ---
+KEY_DISPLAY_SYMBOLS = MappingProxyType({
+    "Caps Lock": "⇪ Caps", "Tab": "⇥ Tab", "Enter": "↵ Enter", "Backspace": "⌫ Bksp",
+    "Up": "↑", "Down": "↓", "Left": "←", "Right": "→",
+    "L Win": "◆", "R Win": "◆", "App": "☰", "Scroll Lock": "Scroll Lk",
+    "Pause": "Pause", "PrtSc":"PrtSc", "Insert":"Ins", "Home":"Home",
+    "Page Up":"PgUp", "Delete":"Del", "End":"End", "Page Down":"PgDn",
+    "L Ctrl":"Ctrl", "R Ctrl":"Ctrl", "L Alt":"Alt", "R Alt":"AltGr",
+    "Space":"Space", "Esc":"Esc", "About":"About", "Set":"Set",
+    "LShift": "⇧ Shift", "RShift": "⇧ Shift",
+    "Minimize":"_", "Close":"X", "Donate":"Donate"
+})
+
+def _build_keyboard_grid_table():
+    """Flattens KEYBOARD_LAYOUT into (row, col, row_span, col_span, key_name, initial_label) tuples."""
+    table = []
+    for r, row_keys in enumerate(KEYBOARD_LAYOUT):
+        col = 0
+        for key_data in row_keys:
+            if key_data:
+                key_name, row_span, col_span = key_data
+                initial_label = "Lang" if key_name.startswith("Lang") else KEY_DISPLAY_SYMBOLS.get(key_name, key_name)
+                table.append((r, col, row_span, col_span, key_name, initial_label))
+                col += col_span
+            else:
+                col += 1
+    return tuple(table)
+
+# Grid positions resolved once at import; the UI iterates this instead of re-walking KEYBOARD_LAYOUT
+KEYBOARD_GRID_TABLE = _build_keyboard_grid_table()
 # file:key_definition.py
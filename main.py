@@ -6,6 +6,7 @@
 
 import sys
 import os
+import logging
 import traceback
 
 # --- استيراد PyQt6 أولاً للتحقق منه ---
@@ -42,6 +43,9 @@ APP_GUID = "PyXKeyboard_Khaled1512_AppGuid_v1" # اجعله فريدًا جدً
 
 # --- الدالة الرئيسية التي تحتوي على منطق التطبيق ---
 def main():
+    # Per-event messages (mouse, key presses) go through logging and stay quiet unless --debug is given
+    logging.basicConfig(level=logging.DEBUG if "--debug" in sys.argv else logging.WARNING,
+                        format="%(name)s: %(message)s")
     print("Starting Python XKeyboard Application...")
     print(f"Using settings directory: {SETTINGS_DIR}")
 
@@ -52,6 +56,10 @@ def main():
     if not os.environ.get("DISPLAY"):
          print("--- WARNING: DISPLAY environment variable not set. X features may fail. ---")
 
+    # The keyboard is a grid of non-overlapping buttons, so Qt's opaque-sibling clipping pass
+    # only adds an O(siblings) walk to every button repaint. Must be set before QApplication.
+    os.environ.setdefault("QT_NO_SUBTRACTOPAQUESIBLINGS", "1")
+
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False) # مهم ليبقى الخادم يعمل
 
@@ -8,7 +8,6 @@
 # Contains the SettingsDialog class for the settings/help window.
 
 import os
-import copy # For deepcopy
 try:
     from PyQt6.QtWidgets import (
         QDialog, QTabWidget, QCheckBox, QVBoxLayout, QDialogButtonBox,
@@ -22,7 +21,10 @@ except ImportError:
     print("Please install it: pip install PyQt6")
     raise
 
-from .settings_manager import DEFAULT_SETTINGS
+from .settings_manager import DEFAULT_SETTINGS, clone_settings
+
+# Help HTML is read from disk once per process and reused for every dialog open
+_HELP_HTML_CACHE = {}
 
 
 class SettingsDialog(QDialog):
@@ -33,7 +35,7 @@ class SettingsDialog(QDialog):
         """ Initializes the dialog. """
         super().__init__(parent)
         self.original_settings_data = settings_data # Keep reference to original dict
-        self.temp_settings = copy.deepcopy(settings_data) # Work on a copy
+        self.temp_settings = clone_settings(settings_data) # Work on a copy
         self.is_focus_monitor_available = is_focus_monitor_available
 
         self.current_preview_font = QFont(current_font)
@@ -61,6 +63,11 @@ class SettingsDialog(QDialog):
 
     def _load_help_file(self, browser_widget, filename, tab_title):
         """ Helper function to load HTML content from a file into a QTextBrowser. """
+        html_content = _HELP_HTML_CACHE.get(filename)
+        if html_content is not None:
+            browser_widget.setHtml(html_content)
+            return
+
         try:
             script_dir = os.path.dirname(os.path.abspath(__file__))
             guide_file_path = os.path.join(script_dir, filename)
@@ -68,6 +75,7 @@ class SettingsDialog(QDialog):
             if os.path.exists(guide_file_path):
                 with open(guide_file_path, 'r', encoding='utf-8') as f:
                     html_content = f.read()
+                _HELP_HTML_CACHE[filename] = html_content
                 browser_widget.setHtml(html_content)
             else:
                 print(f"-> User guide file not found: {guide_file_path}")
@@ -153,7 +161,9 @@ class SettingsDialog(QDialog):
         self.font_preview_label = QLabel("AaBbCc | أبجد هوز")
         self.font_preview_label.setFont(self.current_preview_font)
         initial_text_color_str = self.temp_settings.get("text_color", DEFAULT_SETTINGS.get("text_color", "#000000"))
-        self.font_preview_label.setStyleSheet(f"color: {initial_text_color_str};")
+        # Palettes are created once and mutated on each color pick (no per-update CSS parsing)
+        self._preview_palette = self.font_preview_label.palette()
+        self._update_font_preview_color(initial_text_color_str)
         appearance_layout.addRow(QLabel("Font Preview:"), self.font_preview_label)
 
         # --- Text Color ---
@@ -164,6 +174,7 @@ class SettingsDialog(QDialog):
         text_color_hbox.addWidget(self.text_color_button)
         self.text_color_preview = QLabel()
         self.text_color_preview.setMinimumSize(40, 20); self.text_color_preview.setAutoFillBackground(True)
+        self._text_color_swatch_palette = self.text_color_preview.palette()
         self._update_text_color_preview(initial_text_color_str)
         text_color_hbox.addWidget(self.text_color_preview); text_color_hbox.addStretch(1)
         appearance_layout.addRow(text_color_label, text_color_hbox)
@@ -333,16 +344,24 @@ class SettingsDialog(QDialog):
             self.temp_settings["text_color"] = new_color_str
             self._update_text_color_preview(new_color_str)
             # Update font preview immediately as well
-            self.font_preview_label.setStyleSheet(f"color: {new_color_str};")
+            self._update_font_preview_color(new_color_str)
 
     def _update_text_color_preview(self, color_str):
-        palette = self.text_color_preview.palette()
+        palette = self._text_color_swatch_palette
         try:
             palette.setColor(QPalette.ColorRole.Window, QColor(color_str))
             self.text_color_preview.setPalette(palette)
         except Exception as e:
             print(f"Error updating text color preview: {e}")
 
+    def _update_font_preview_color(self, color_str):
+        palette = self._preview_palette
+        try:
+            palette.setColor(QPalette.ColorRole.WindowText, QColor(color_str))
+            self.font_preview_label.setPalette(palette)
+        except Exception as e:
+            print(f"Error updating font preview color: {e}")
+
     def on_use_system_colors_changed(self, state_value):
         use_system = (state_value == Qt.CheckState.Checked.value)
         self.temp_settings["use_system_colors"] = use_system
@@ -10,7 +10,6 @@
 import os
 import json
 import sys # For error printing
-import copy # For deepcopy
 
 # --- *** تعديل: تغيير اسم المجلد *** ---
 # Define the directory and file for storing settings
@@ -44,9 +43,20 @@ DEFAULT_SETTINGS = {
     "auto_repeat_enabled": True,
     "auto_repeat_delay_ms": 1000,      # Changed repeat delay
     "auto_repeat_interval_ms": 100,
+    # Inject keys through a /dev/uinput device instead of XTEST (read at startup). Off by default: X adds
+    # the device as a new keyboard with the server's default XKB setup, which may not match the runtime layout
+    "use_uinput_backend": False,
 }
 # --- *** نهاية التعديل *** ---
 
+def clone_settings(settings_dict):
+    """ Copies a settings dictionary. Values are JSON primitives or one level of dict/list
+        (e.g. window_geometry), so a two-level copy is a full copy without deepcopy's overhead.
+    """
+    return {key: (value.copy() if isinstance(value, (dict, list)) else value)
+            for key, value in settings_dict.items()}
+
+
 def load_settings():
     """ Loads settings from the JSON file.
         Returns the loaded settings dictionary or defaults on error.
@@ -54,7 +64,7 @@ def load_settings():
     print(f"Attempting to load settings from: {SETTINGS_FILE}")
     if not os.path.exists(SETTINGS_FILE):
         print(f"-> Settings file not found, using defaults.")
-        return copy.deepcopy(DEFAULT_SETTINGS)
+        return clone_settings(DEFAULT_SETTINGS)
 
     try:
         with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
@@ -63,7 +73,7 @@ def load_settings():
             print(f"-> Successfully loaded JSON data.")
 
             # Merge with defaults to ensure all keys exist
-            settings = copy.deepcopy(DEFAULT_SETTINGS)
+            settings = clone_settings(DEFAULT_SETTINGS)
             # --- Handle potential invalid geometry from old file ---
             if "window_geometry" in loaded_settings and not isinstance(loaded_settings["window_geometry"], dict):
                 print("   - Ignoring invalid 'window_geometry' from saved file.")
@@ -80,10 +90,10 @@ def load_settings():
 
     except (json.JSONDecodeError, IOError) as e:
         print(f"-> ERROR loading settings file ({SETTINGS_FILE}): {e}. Using defaults.", file=sys.stderr)
-        return copy.deepcopy(DEFAULT_SETTINGS)
+        return clone_settings(DEFAULT_SETTINGS)
     except Exception as e:
         print(f"-> UNEXPECTED ERROR loading settings: {e}. Using defaults.", file=sys.stderr)
-        return copy.deepcopy(DEFAULT_SETTINGS)
+        return clone_settings(DEFAULT_SETTINGS)
 
 
 def save_settings(settings_dict):
@@ -94,17 +104,16 @@ def save_settings(settings_dict):
             os.makedirs(SETTINGS_DIR, exist_ok=True)
             print(f"-> Created settings directory: {SETTINGS_DIR}")
 
-        # Ensure all current default keys exist before saving
-        settings_to_save = copy.deepcopy(DEFAULT_SETTINGS)
         # --- Handle potential invalid geometry before saving ---
         if "window_geometry" in settings_dict and not isinstance(settings_dict["window_geometry"], dict):
              print("   - Removing invalid 'window_geometry' before saving.")
              settings_dict.pop("window_geometry", None) # Remove if invalid
         # --- End Geometry Check ---
-        settings_to_save.update(settings_dict)
 
+        # Missing keys are backfilled from DEFAULT_SETTINGS by load_settings(),
+        # so the dict is written as-is instead of being merged over a defaults copy.
         with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings_to_save, f, indent=4, ensure_ascii=False)
+            json.dump(settings_dict, f, indent=4, ensure_ascii=False)
         print(f"-> Settings save successful.")
 
     except IOError as e:
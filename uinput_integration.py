@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# File: uinput_integration.py
+# PyXKeyboard v1.0.7 - Kernel uinput key injection for VirtualKeyboard
+# Developed by Khaled Abdelhamid (khaled1512@gmail.com) - Licensed under GPLv3.
+# Creates a virtual keyboard device on /dev/uinput and writes key events to it.
+# Keycodes are X11 keycodes (as returned by keysym_to_keycode); the X server's
+# evdev/libinput drivers map kernel codes to X keycodes with a fixed +8 offset.
+
+import os
+import sys
+import struct
+try:
+    import fcntl
+except ImportError: # Non-POSIX platform
+    fcntl = None
+
+UINPUT_DEVICE_PATH = "/dev/uinput"
+
+# --- linux/input-event-codes.h / linux/uinput.h constants ---
+_EV_SYN = 0x00
+_EV_KEY = 0x01
+_SYN_REPORT = 0
+_UI_SET_EVBIT = 0x40045564  # _IOW('U', 100, int)
+_UI_SET_KEYBIT = 0x40045565 # _IOW('U', 101, int)
+_UI_DEV_CREATE = 0x5501     # _IO('U', 1)
+_UI_DEV_DESTROY = 0x5502    # _IO('U', 2)
+_BUS_VIRTUAL = 0x06
+_X_KEYCODE_OFFSET = 8       # X keycode = kernel key code + 8
+_X_KEY_PRESS = 2            # Xlib.X.KeyPress (KeyRelease is 3)
+_MAX_KERNEL_KEY = 255 - _X_KEYCODE_OFFSET # Highest code reachable from an X keycode
+
+_INPUT_EVENT = struct.Struct('llHHi') # struct input_event: timeval, type, code, value
+_USER_DEV = struct.Struct('80sHHHHI256i') # struct uinput_user_dev: name, input_id, ff_effects_max, abs tables
+_SYN_EVENT = _INPUT_EVENT.pack(0, 0, _EV_SYN, _SYN_REPORT, 0)
+
+# Module-level state variables
+_fd = None          # File descriptor of the created uinput device
+_pending = []       # Packed events queued by send_uinput_key_nosync, written by flush_uinput
+
+
+def initialize_uinput() -> bool:
+    """
+    Creates the virtual keyboard device if /dev/uinput is writable.
+    Returns True on success, False if uinput is unavailable (callers fall back to XTEST).
+    """
+    global _fd
+    if _fd is not None:
+        return True
+    if fcntl is None or not os.access(UINPUT_DEVICE_PATH, os.W_OK):
+        return False
+
+    fd = None
+    try:
+        fd = os.open(UINPUT_DEVICE_PATH, os.O_WRONLY | os.O_NONBLOCK)
+        fcntl.ioctl(fd, _UI_SET_EVBIT, _EV_KEY)
+        for code in range(1, _MAX_KERNEL_KEY + 1):
+            fcntl.ioctl(fd, _UI_SET_KEYBIT, code)
+        os.write(fd, _USER_DEV.pack(b"PyXKeyboard virtual keyboard", _BUS_VIRTUAL, 0x1, 0x1, 1, 0, *([0] * 256)))
+        fcntl.ioctl(fd, _UI_DEV_CREATE)
+    except OSError as e:
+        print(f"uinput Initialized (Integration): ERROR - {e} (using XTEST)", file=sys.stderr)
+        if fd is not None:
+            try: os.close(fd)
+            except OSError: pass
+        return False
+
+    _fd = fd
+    print(f"uinput Initialized (Integration): SUCCESS ({UINPUT_DEVICE_PATH})")
+    return True
+
+
+def is_uinput_ok() -> bool:
+    """ Returns True if the uinput device was created. """
+    return _fd is not None
+
+
+def send_uinput_key_nosync(event_type, keycode) -> bool:
+    """ Queues a key press/release for an X keycode. event_type is X.KeyPress (2) or X.KeyRelease (3).
+        Callers must finish with flush_uinput(). Returns False if the keycode cannot be injected.
+    """
+    code = keycode - _X_KEYCODE_OFFSET
+    if _fd is None or not (1 <= code <= _MAX_KERNEL_KEY):
+        return False
+    _pending.append(_INPUT_EVENT.pack(0, 0, _EV_KEY, code, 1 if event_type == _X_KEY_PRESS else 0))
+    _pending.append(_SYN_EVENT)
+    return True
+
+
+def flush_uinput() -> bool:
+    """ Writes all queued events in a single write() call. Returns True on success. """
+    if not _pending:
+        return True
+    data = b"".join(_pending)
+    _pending.clear()
+    if _fd is None:
+        return False
+    try:
+        os.write(_fd, data)
+        return True
+    except OSError as e:
+        print(f"ERROR writing uinput events: {e}", file=sys.stderr)
+        return False
+
+
+def close_uinput():
+    """ Destroys the virtual keyboard device if it was created. """
+    global _fd
+    _pending.clear()
+    if _fd is None:
+        return
+    try:
+        fcntl.ioctl(_fd, _UI_DEV_DESTROY)
+    except OSError as e:
+        print(f"ERROR destroying uinput device: {e}", file=sys.stderr)
+    try: os.close(_fd)
+    except OSError: pass
+    _fd = None
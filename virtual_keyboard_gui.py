@@ -7,21 +7,24 @@
 import sys
 import os
 from typing import Optional, Tuple, Dict, List, Union
-import copy
+import contextlib
+import logging
 
 try:
     from PyQt6.QtWidgets import (
-        QApplication, QMainWindow, QWidget, QGridLayout, QMessageBox, QPushButton
+        QApplication, QMainWindow, QWidget, QGridLayout, QPushButton
     )
-    from PyQt6.QtCore import Qt, QPoint, QTimer, pyqtSlot, QRect
+    from PyQt6.QtCore import Qt, QPoint, QTimer, pyqtSlot, pyqtSignal, QSocketNotifier, QEvent
     from PyQt6.QtGui import QFont, QColor, QIcon, QAction, QScreen, QActionGroup 
     from PyQt6.QtWidgets import QSystemTrayIcon, QMenu 
 except ImportError:
     print("ERROR: PyQt6 library is required for the main GUI.")
     raise
 
-from .settings_manager import load_settings, save_settings, DEFAULT_SETTINGS
+from .settings_manager import load_settings, save_settings, clone_settings, DEFAULT_SETTINGS
 from . import xlib_integration as xlib_int
+from . import uinput_integration as uinput_int
+from .key_definitions import MOD_SHIFT, MOD_CTRL, MOD_ALT, MOD_CAPS
 if not xlib_int.is_dummy():
     import Xlib 
     from Xlib import X as X_CONST_REAL 
@@ -37,12 +40,14 @@ from .vk_ui import (
     get_resize_edge, update_cursor_shape, EDGE_NONE, EDGE_TOP, EDGE_BOTTOM, EDGE_LEFT, EDGE_RIGHT, revert_button_flash
 )
 from .vk_layout_handling import (
-    init_xkb_manager_and_layouts, update_key_labels_on_layout_change, update_single_key_label
+    init_xkb_manager_and_layouts, start_layout_change_monitoring, update_key_labels_on_layout_change, update_single_key_label,
+    stop_xkb_event_notifier, start_layout_query, handle_layout_query_result, LAYOUT_POLL_INTERVAL_MS
 )
 from .vk_key_simulation import (
     on_modifier_key_press, on_non_repeatable_key_press,
     _send_xtest_key_event, _simulate_single_key_press_event,
-    on_typable_key_right_press, _handle_key_pressed_simulation, _handle_key_released_simulation
+    on_typable_key_right_press, _handle_key_pressed_simulation, _handle_key_released_simulation,
+    refresh_keycode_cache, init_input_backend
 )
 from .vk_auto_repeat import (
     update_repeat_timers_from_settings,
@@ -52,7 +57,7 @@ from .vk_dialogs import show_about_message, open_settings_dialog, open_donate_li
 from .vk_tray_utils import (
     init_or_update_tray_icon, tray_icon_activated, 
     update_tray_menu_language_check_state, hide_to_tray,
-    update_tray_status_display 
+    update_tray_status_display, update_tray_hide_action, notify
 )
 
 
@@ -68,8 +73,37 @@ except Exception as e:
     print(f"WARNING: Unexpected error importing EditableFocusMonitor: {e}")
     EditableFocusMonitor = None
 
+log = logging.getLogger(__name__) # For messages on interactive paths (key presses, layout switching)
+
+# Mouse button enum members, compared by identity in the window's mouse handlers
+_LEFT_BUTTON = Qt.MouseButton.LeftButton
+_MIDDLE_BUTTON = Qt.MouseButton.MiddleButton
+_RIGHT_BUTTON = Qt.MouseButton.RightButton
+
+# Settings whose change needs a restyle / new repeat timer intervals (see _apply_settings_from_dialog)
+_STYLE_SETTING_KEYS = frozenset({
+    "font_family", "font_size", "use_system_colors", "window_background_color",
+    "button_background_color", "window_opacity", "text_color", "button_style",
+})
+_REPEAT_SETTING_KEYS = frozenset({"auto_repeat_delay_ms", "auto_repeat_interval_ms"})
+
+
+def _mod_state_flag(bit: int) -> property:
+    """Bool view of one MOD_* bit of VirtualKeyboard._mod_state."""
+    def getter(self) -> bool:
+        return bool(self._mod_state & bit)
+    def setter(self, value: bool):
+        if value: self._mod_state |= bit
+        else: self._mod_state &= ~bit
+    return property(getter, setter)
+
 
 class VirtualKeyboard(QMainWindow):
+    editableFocusDetected = pyqtSignal() # Emitted from the AT-SPI thread; queued to the GUI thread
+    shift_pressed = _mod_state_flag(MOD_SHIFT); ctrl_pressed = _mod_state_flag(MOD_CTRL)
+    alt_pressed = _mod_state_flag(MOD_ALT); caps_lock_pressed = _mod_state_flag(MOD_CAPS)
+    layoutQueryFinished = pyqtSignal(object) # Emitted from a QThreadPool worker with Optional[str]
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Python XKeyboard")
@@ -78,12 +112,19 @@ class VirtualKeyboard(QMainWindow):
         self.is_frameless = self.settings.get("frameless_window", DEFAULT_SETTINGS.get("frameless_window", False))
         self.always_on_top = self.settings.get("always_on_top", DEFAULT_SETTINGS.get("always_on_top", True))
         self.use_system_colors = self.settings.get("use_system_colors", DEFAULT_SETTINGS.get("use_system_colors", False))
+        self._refresh_setting_cache()
 
         self.app_font = QFont()
         load_initial_font_settings(self) 
 
         xlib_int.initialize_xlib()
         self.xlib_ok = xlib_int.is_xtest_ok()
+        self.modifier_keycodes: Tuple[Optional[int], ...] = (None, None, None, None)
+        self.keycodes_by_name: Dict[str, Optional[int]] = {} # Key name -> XTEST keycode (see refresh_keycode_cache)
+        self.refresh_keycode_cache()
+        self.key_event_backend = (xlib_int.send_xtest_event_nosync, xlib_int.flush_display) # (send_nosync, flush)
+        self.key_event_backend_name = "XTEST" # Used in error messages; both set by init_input_backend
+        init_input_backend(self)
         self.is_xlib_dummy = xlib_int.is_dummy()
 
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground) 
@@ -94,13 +135,33 @@ class VirtualKeyboard(QMainWindow):
         self.setWindowFlags(base_flags)
 
         self.resizing = False; self.resize_edge = EDGE_NONE; self.resize_start_pos = None; self.resize_start_geom = None
+        self._resize_min_w = 0; self._resize_min_h = 0
         self.resize_margin = 4 
         self.setMouseTracking(True) 
 
         self.buttons: Dict[str, QPushButton] = {}
+        self._frame_buttons: List[QPushButton] = [] # Minimize/Close; shown only when frameless (filled by init_ui_elements)
+        self._label_specs = None # Per-button label specs (see vk_layout_handling.build_label_specs)
+        self._spec_by_name: Dict[str, tuple] = {} # Key name -> LabelSpec for single-key refreshes
+        self._label_states: List[Optional[Tuple[str, bool]]] = [] # Last (label, toggled) applied per spec
+        self._label_tables: Dict[tuple, List[str]] = {} # (layout, shift, letter shift) -> label per spec
+        self._lang_labels_memo = None # (layout codes, current language, Lang key labels) from the last refresh
         self.current_language = 'us' 
-        self.shift_pressed = False; self.ctrl_pressed = False; self.alt_pressed = False; self.caps_lock_pressed = False
+        self._last_seen_sys: Optional[str] = None # System layout handled by the last full sync pass
+        self._mod_state = 0 # Sticky modifiers as MOD_* bits; shift_pressed etc. are bool views of it
         self.drag_position: Optional[QPoint] = None
+        self._drag_offset_x = 0; self._drag_offset_y = 0 # Int copy of drag_position for the move hot path
+        # Drag moves are coalesced: only the latest target is applied once per event-loop pass
+        self._pending_move: Optional[Tuple[int, int]] = None
+        self._move_timer = QTimer(self); self._move_timer.setSingleShot(True); self._move_timer.setInterval(0)
+        self._move_timer.timeout.connect(self._apply_pending_move)
+        # Bursts of modifier/layout changes are coalesced into one relabel pass (see update_key_labels)
+        self._label_update_timer = QTimer(self); self._label_update_timer.setSingleShot(True); self._label_update_timer.setInterval(12)
+        self._label_update_timer.timeout.connect(self._do_update_key_labels)
+        self._labels_dirty = False # A relabel was requested while the window was hidden
+        # Style setter bursts (settings changes) are coalesced into one stylesheet pass per frame
+        self._restyle_timer = QTimer(self); self._restyle_timer.setSingleShot(True); self._restyle_timer.setInterval(16)
+        self._restyle_timer.timeout.connect(self._apply_global_styles_and_font)
         
         self.xkb_manager = None 
         self.tray_icon: Optional[QSystemTrayIcon] = None
@@ -109,14 +170,29 @@ class VirtualKeyboard(QMainWindow):
         self.language_actions: Dict[str, QAction] = {}
         self.lang_action_group: Optional[QActionGroup] = None
         self.tray_menu: Optional[QMenu] = None
+        self.tray_hide_action: Optional[QAction] = None
+        self._tray_layouts: Optional[tuple] = None # Layout list the tray language submenu was built from
 
         self.focus_monitor: Optional[EditableFocusMonitor] = None
+        # Focus bursts (dialogs, dropdowns) restart this timer, so the keyboard is shown once they settle
+        self._show_debounce_timer = QTimer(self); self._show_debounce_timer.setSingleShot(True); self._show_debounce_timer.setInterval(150)
+        self._show_debounce_timer.timeout.connect(self.show_normal_and_raise)
+        self.editableFocusDetected.connect(self._show_debounce_timer.start)
         self.focus_monitor_available = _focus_monitor_available
         self.monitor_was_running_for_context_menu = False 
 
         self.layout_check_timer: Optional[QTimer] = None 
+        self._layout_query_in_flight = False # A background layout query is running (see vk_layout_handling)
+        self.layoutQueryFinished.connect(self._on_layout_query_result, Qt.ConnectionType.QueuedConnection)
+        self.xkb_event_notifier: Optional[QSocketNotifier] = None # XKB group change events (see vk_layout_handling)
+        self.xkb_event_display = None; self.xkb_event_code = 0
+        # Bursts of layoutChanged (rapid switching) collapse into one sync with the last reported layout
+        self._pending_sys_lang: Optional[str] = None
+        self._lang_coalesce_timer = QTimer(self); self._lang_coalesce_timer.setSingleShot(True); self._lang_coalesce_timer.setInterval(50)
+        self._lang_coalesce_timer.timeout.connect(self._apply_pending_sys_lang)
 
         self.loaded_layouts: Dict[str, Dict[str, Union[list, tuple]]] = {} 
+        self._default_fallback_layout: Optional[str] = None # Visual layout for unknown system layouts (see sync)
         self.layouts_dir = os.path.join(os.path.dirname(__file__), 'layouts')
 
         self.repeating_key_name: Optional[str] = None
@@ -126,15 +202,17 @@ class VirtualKeyboard(QMainWindow):
         self.auto_repeat_timer.timeout.connect(lambda: trigger_subsequent_repeat(self))
         update_repeat_timers_from_settings(self) 
 
-        init_xkb_manager_and_layouts(self) 
+        init_xkb_manager_and_layouts(self, start_monitoring=False) # Monitors start in _start_monitors
 
+        self._last_style_key = None # Inputs of the last applied stylesheet (see apply_global_styles_and_font)
+        self._base_window_rgb: Optional[Tuple[int, int, int]] = None # Cached palette Window color
         self.central_widget = QWidget(); self.central_widget.setObjectName("centralWidget")
         self.central_widget.setMouseTracking(True); self.central_widget.setAutoFillBackground(True)
         self.setCentralWidget(self.central_widget)
         self.grid_layout = QGridLayout(self.central_widget)
         self.grid_layout.setSpacing(3); self.grid_layout.setContentsMargins(5, 5, 5, 5)
 
-        self.init_focus_monitor() 
+        self.init_focus_monitor(start_monitor=False) 
         apply_global_styles_and_font(self) 
         init_ui_elements(self) 
 
@@ -142,20 +220,24 @@ class VirtualKeyboard(QMainWindow):
         init_or_update_tray_icon(self) 
         apply_initial_geometry(self) 
 
-        initial_lang_from_xkb = self.xkb_manager.get_current_layout_name() if self.xkb_manager else None
-        final_initial_lang = 'us' 
-        if initial_lang_from_xkb:
-            if initial_lang_from_xkb in self.loaded_layouts:
-                final_initial_lang = initial_lang_from_xkb
-            elif 'us' in self.loaded_layouts: final_initial_lang = 'us'
-            elif 'en' in self.loaded_layouts: final_initial_lang = 'en'
-            elif self.loaded_layouts: final_initial_lang = next(iter(self.loaded_layouts))
-        elif 'us' in self.loaded_layouts: final_initial_lang = 'us'
-        elif 'en' in self.loaded_layouts: final_initial_lang = 'en'
-        elif self.loaded_layouts: final_initial_lang = next(iter(self.loaded_layouts))
-
+        final_initial_lang = self._pick_initial_lang(self.xkb_manager.get_current_layout_name() if self.xkb_manager else None)
         self.sync_vk_lang_with_system_slot(final_initial_lang)
-        self.update_key_labels() 
+        self._label_update_timer.stop(); self._do_update_key_labels() # Show correct labels on first paint
+        QTimer.singleShot(0, self._start_monitors) # Runs once the event loop is up, after the first show()
+
+    def _pick_initial_lang(self, sys_lang: Optional[str]) -> str:
+        """First loaded layout among: the system layout, 'us', 'en', then any registered code."""
+        candidates = (sys_lang, 'us', 'en', *self.loaded_layouts)
+        return next((code for code in candidates if code and code in self.loaded_layouts), 'us')
+
+    def _start_monitors(self):
+        """Starts the layout change and AT-SPI focus monitors (deferred from __init__ so they don't delay first paint)."""
+        start_layout_change_monitoring(self)
+        if self.focus_monitor and self._auto_show_on_edit:
+            try:
+                self._start_focus_monitor_for_auto_show()
+            except Exception as e:
+                print(f"ERROR starting AT-SPI focus monitor: {e}", file=sys.stderr)
 
     # --- دالة جديدة لتنشيط النافذة ---
     def activate_and_show(self):
@@ -187,7 +269,7 @@ class VirtualKeyboard(QMainWindow):
     _revert_button_flash = lambda self, btn, style: revert_button_flash(self, btn, style)
 
     _init_xkb_manager = lambda self: init_xkb_manager_and_layouts(self) 
-    update_key_labels = lambda self: update_key_labels_on_layout_change(self)
+    _do_update_key_labels = lambda self: update_key_labels_on_layout_change(self)
     update_single_key_label = lambda self, key_name: update_single_key_label(self, key_name)
 
     on_modifier_key_press = lambda self, key_name: on_modifier_key_press(self, key_name)
@@ -197,6 +279,7 @@ class VirtualKeyboard(QMainWindow):
     on_typable_key_right_press = lambda self, key_name: on_typable_key_right_press(self, key_name)
     _handle_key_pressed = lambda self, key_name: _handle_key_pressed_simulation(self, key_name)
     _handle_key_released = lambda self, key_name, force_stop=False: _handle_key_released_simulation(self, key_name, force_stop)
+    refresh_keycode_cache = lambda self: refresh_keycode_cache(self)
 
     _update_repeat_timers_from_settings = lambda self: update_repeat_timers_from_settings(self)
     
@@ -209,6 +292,8 @@ class VirtualKeyboard(QMainWindow):
     _update_tray_menu_language_check_state = lambda self: update_tray_menu_language_check_state(self) 
     hide_to_tray = lambda self: hide_to_tray(self)
     _update_tray_status_display = lambda self: update_tray_status_display(self)
+    _update_tray_hide_action = lambda self: update_tray_hide_action(self)
+    _notify = lambda self, title, message, critical=False: notify(self, title, message, critical)
 
 
     def _pause_focus_monitor_if_running(self) -> bool:
@@ -221,8 +306,17 @@ class VirtualKeyboard(QMainWindow):
                 print(f"ERROR stopping focus monitor: {e}")
         return False
 
+    @contextlib.contextmanager
+    def _paused_focus_monitor(self):
+        """Pauses the AT-SPI focus monitor around a modal dialog; yields whether it was running."""
+        was_running = self._pause_focus_monitor_if_running()
+        try:
+            yield was_running
+        finally:
+            self._resume_focus_monitor_if_needed(was_running)
+
     def _resume_focus_monitor_if_needed(self, was_running_before: bool):
-        setting_is_enabled = self.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False))
+        setting_is_enabled = self._auto_show_on_edit
         if was_running_before and setting_is_enabled:
             print("Resuming AT-SPI focus monitor...")
             if self.focus_monitor:
@@ -242,7 +336,7 @@ class VirtualKeyboard(QMainWindow):
                 except Exception as e: print(f"ERROR ensuring disabled focus monitor is stopped: {e}")
 
 
-    def init_focus_monitor(self):
+    def init_focus_monitor(self, start_monitor: bool = True):
         if not _focus_monitor_available or EditableFocusMonitor is None:
             print("Focus monitor skipped (module or dependencies unavailable).")
             self.focus_monitor = None
@@ -254,13 +348,10 @@ class VirtualKeyboard(QMainWindow):
             print("EditableFocusMonitor instance created.")
             self.focus_monitor_available = True 
 
-            if self.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False)):
-                print("Auto-show on edit is enabled, attempting to start AT-SPI monitor...")
-                self.focus_monitor.start()
-                if not self.focus_monitor.is_running():
-                    print("WARNING: Could not start AT-SPI focus monitor after initialization attempt.")
-            else:
+            if not self._auto_show_on_edit:
                 print("Auto-show on edit is disabled in settings.")
+            elif start_monitor:
+                self._start_focus_monitor_for_auto_show()
         except ImportError as e: 
             print(f"Focus monitor disabled due to import error: {e}", file=sys.stderr)
             self.focus_monitor = None
@@ -271,11 +362,18 @@ class VirtualKeyboard(QMainWindow):
             self.focus_monitor_available = False
 
 
+    def _start_focus_monitor_for_auto_show(self):
+        """Startup start of the AT-SPI monitor (init_focus_monitor or the deferred _start_monitors); errors propagate."""
+        print("Auto-show on edit is enabled, attempting to start AT-SPI monitor...")
+        self.focus_monitor.start()
+        if not self.focus_monitor.is_running():
+            print("WARNING: Could not start AT-SPI focus monitor after initialization attempt.")
+
     def _handle_editable_focus_event(self, accessible_object): 
-        if self.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False)):
+        if self._auto_show_on_edit:
             if self.isHidden() or self.isMinimized():
                 print("Editable field focused (AT-SPI), showing keyboard...")
-                QTimer.singleShot(50, self.show_normal_and_raise)
+                self.editableFocusDetected.emit()
 
     def show_normal_and_raise(self):
         if self.isHidden() or self.isMinimized():
@@ -284,59 +382,79 @@ class VirtualKeyboard(QMainWindow):
         self.raise_()         
 
 
+    def _refresh_setting_cache(self):
+        """Copies settings read from event handlers and status code into attributes (one load instead of two dict lookups)."""
+        self._auto_show_on_edit = self.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False))
+        self._auto_hide_on_middle_click = self.settings.get("auto_hide_on_middle_click", DEFAULT_SETTINGS.get("auto_hide_on_middle_click", True))
+        self._remember_geometry = self.settings.get("remember_geometry", DEFAULT_SETTINGS.get("remember_geometry", True))
+
     def _apply_settings_from_dialog(self, applied_settings: dict):
         print("Applying settings from dialog...")
         previous_frameless = self.is_frameless
         previous_on_top = self.always_on_top
-        previous_auto_show = self.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False))
+        previous_auto_show = self._auto_show_on_edit
+        previous_settings = self.settings
 
-        self.settings = copy.deepcopy(applied_settings) 
+        self.settings = clone_settings(applied_settings) 
+        self._refresh_setting_cache()
+        changed_keys = {key for key in self.settings.keys() | previous_settings.keys()
+                        if self.settings.get(key) != previous_settings.get(key)}
+        style_changed = not changed_keys.isdisjoint(_STYLE_SETTING_KEYS)
 
         self.is_frameless = self.settings.get("frameless_window", DEFAULT_SETTINGS.get("frameless_window", False))
         self.always_on_top = self.settings.get("always_on_top", DEFAULT_SETTINGS.get("always_on_top", True))
         
-        self.update_window_background_color(self.settings.get("window_background_color", DEFAULT_SETTINGS.get("window_background_color", "#F0F0F0")))
-        self.update_button_background_color(self.settings.get("button_background_color", DEFAULT_SETTINGS.get("button_background_color", "#E1E1E1")))
-
-        new_font = QFont(self.settings.get("font_family", DEFAULT_SETTINGS.get("font_family", "Sans Serif")),
-                         self.settings.get("font_size", DEFAULT_SETTINGS.get("font_size", 9)))
-        if new_font != self.app_font: 
-            self.update_application_font(new_font)
-
-        self.update_application_opacity(self.settings.get("window_opacity", DEFAULT_SETTINGS.get("window_opacity", 1.0)))
-        self.update_application_text_color(self.settings.get("text_color", DEFAULT_SETTINGS.get("text_color", "#000000")))
-        self.update_application_button_style(self.settings.get("button_style", DEFAULT_SETTINGS.get("button_style", "default")))
-        
-        self._update_repeat_timers_from_settings() 
-
-        flags_changed = (self.is_frameless != previous_frameless or self.always_on_top != previous_on_top)
-        if flags_changed:
-            print("Window flags (frameless/always_on_top) changed, re-applying...")
-            base_flags = Qt.WindowType.Window | Qt.WindowType.WindowDoesNotAcceptFocus
-            if self.always_on_top: base_flags |= Qt.WindowType.WindowStaysOnTopHint
-            if self.is_frameless: base_flags |= Qt.WindowType.FramelessWindowHint
-            else: base_flags |= (Qt.WindowType.WindowMinimizeButtonHint | Qt.WindowType.WindowCloseButtonHint | Qt.WindowType.CustomizeWindowHint)
+        # Restyling, relabelling and flag changes each trigger repaints; batch them into a single update
+        self.setUpdatesEnabled(False)
+        try:
+            if style_changed: # Each setter normalizes its value and skips restyling if it is already stored
+                self.update_window_background_color(self.settings.get("window_background_color", DEFAULT_SETTINGS.get("window_background_color", "#F0F0F0")))
+                self.update_button_background_color(self.settings.get("button_background_color", DEFAULT_SETTINGS.get("button_background_color", "#E1E1E1")))
+
+                new_font = QFont(self.settings.get("font_family", DEFAULT_SETTINGS.get("font_family", "Sans Serif")),
+                                 self.settings.get("font_size", DEFAULT_SETTINGS.get("font_size", 9)))
+                if new_font != self.app_font: 
+                    self.update_application_font(new_font)
+
+                self.update_application_opacity(self.settings.get("window_opacity", DEFAULT_SETTINGS.get("window_opacity", 1.0)))
+                self.update_application_text_color(self.settings.get("text_color", DEFAULT_SETTINGS.get("text_color", "#000000")))
+                self.update_application_button_style(self.settings.get("button_style", DEFAULT_SETTINGS.get("button_style", "default")))
+
+            if not changed_keys.isdisjoint(_REPEAT_SETTING_KEYS):
+                self._update_repeat_timers_from_settings() 
+
+            flags_changed = (self.is_frameless != previous_frameless or self.always_on_top != previous_on_top)
+            if flags_changed:
+                print("Window flags (frameless/always_on_top) changed, re-applying...")
+                base_flags = Qt.WindowType.Window | Qt.WindowType.WindowDoesNotAcceptFocus
+                if self.always_on_top: base_flags |= Qt.WindowType.WindowStaysOnTopHint
+                if self.is_frameless: base_flags |= Qt.WindowType.FramelessWindowHint
+                else: base_flags |= (Qt.WindowType.WindowMinimizeButtonHint | Qt.WindowType.WindowCloseButtonHint | Qt.WindowType.CustomizeWindowHint)
             
-            current_visibility = self.isVisible()
-            self.hide() 
-            self.setWindowFlags(base_flags)
-            self._apply_global_styles_and_font() 
-
-            for key_name_btn in ['Minimize', 'Close']:
-                if key_name_btn in self.buttons:
-                    self.buttons[key_name_btn].setVisible(self.is_frameless)
-            print("Custom Minimize/Close button visibility updated based on frameless state.")
+                current_visibility = self.isVisible()
+                self.hide() 
+                self.setWindowFlags(base_flags)
+                self._restyle_timer.stop() # The setters' pending restyle is folded into this immediate one
+                self._apply_global_styles_and_font() 
+
+                for frame_button in self._frame_buttons:
+                    frame_button.setVisible(self.is_frameless)
+                print("Custom Minimize/Close button visibility updated based on frameless state.")
             
-            if current_visibility: 
-                QTimer.singleShot(50, self.show) 
-            else:
-                print("Window was hidden, keeping it hidden after flag change.")
-        else: 
-            self._apply_global_styles_and_font()
-            self.update_key_labels() 
-            print("Styles and labels updated (no window flag change).")
+                if current_visibility: 
+                    QTimer.singleShot(50, self.show) 
+                else:
+                    print("Window was hidden, keeping it hidden after flag change.")
+            elif style_changed: 
+                # Run now rather than on the debounce timers, so both land inside this updates-disabled block
+                self._restyle_timer.stop(); self._apply_global_styles_and_font()
+                self._label_update_timer.stop(); self._do_update_key_labels()
+                print("Styles and labels updated (no window flag change).")
+        finally:
+            self.setUpdatesEnabled(True)
+            self.update()
         
-        current_auto_show = self.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False))
+        current_auto_show = self._auto_show_on_edit
         if current_auto_show != previous_auto_show:
             if current_auto_show:
                 if self.focus_monitor and not self.focus_monitor.is_running():
@@ -349,44 +467,87 @@ class VirtualKeyboard(QMainWindow):
                     print("Auto-show disabled in settings, stopping AT-SPI monitor...")
                     self.focus_monitor.stop()
         
-        self.init_tray_icon() 
+        self._update_tray_hide_action()
+        self._update_tray_status_display()
 
+    # --- Shared key button slots: one slot per signal kind, the key comes from the sender's "key_name" ---
+    @pyqtSlot()
+    def _on_key_button_pressed(self):
+        self._handle_key_pressed(self.sender().property("key_name"))
+
+    @pyqtSlot()
+    def _on_key_button_released(self):
+        self._handle_key_released(self.sender().property("key_name"))
+
+    @pyqtSlot()
+    def _on_modifier_button_clicked(self):
+        self.on_modifier_key_press(self.sender().property("key_name"))
+
+    @pyqtSlot()
+    def _on_non_repeatable_button_clicked(self):
+        self.on_non_repeatable_key_press(self.sender().property("key_name"))
+
+    @pyqtSlot(QPoint)
+    def _on_key_button_context_menu(self, pos):
+        self.on_typable_key_right_press(self.sender().property("key_name"))
+
+    def _request_restyle(self):
+        """Schedules apply_global_styles_and_font; calls within the interval share one pass."""
+        if not self._restyle_timer.isActive():
+            self._restyle_timer.start()
+
+    def update_key_labels(self):
+        """Schedules a relabel of all keys; repeated calls within the debounce interval share one pass."""
+        if not self.isVisible():
+            self._labels_dirty = True # Hidden (e.g. in the tray); relabel once in showEvent
+            return
+        if not self._label_update_timer.isActive():
+            self._label_update_timer.start()
+
+    @pyqtSlot(str)
+    def _queue_system_layout_sync(self, new_layout_name: str):
+        """layoutChanged handler: remembers the newest layout and (re)starts the coalescing timer."""
+        self._pending_sys_lang = new_layout_name
+        self._lang_coalesce_timer.start()
+
+    def _apply_pending_sys_lang(self):
+        new_layout_name, self._pending_sys_lang = self._pending_sys_lang, None
+        if new_layout_name is not None:
+            self.sync_vk_lang_with_system_slot(new_layout_name)
+
+    @pyqtSlot()
     @pyqtSlot(str)
     def sync_vk_lang_with_system_slot(self, new_layout_name: Optional[str] = None):
         if not self.xkb_manager: return
 
         current_sys_name = new_layout_name if new_layout_name is not None else self.xkb_manager.query_current_layout_name()
 
+        if current_sys_name and current_sys_name == self._last_seen_sys and self.xkb_manager.get_current_layout_name() == current_sys_name:
+            return # Nothing changed since the last sync (the common case when polled/notified)
+
         if current_sys_name:
             target_vk_lang = current_sys_name
-            layout_exists = target_vk_lang in self.loaded_layouts
-            
-            if not layout_exists: 
-                if target_vk_lang.startswith('en') and 'us' in self.loaded_layouts: target_vk_lang = 'us'; layout_exists = True
-                elif 'us' in self.loaded_layouts: target_vk_lang = 'us'; layout_exists = True
-                elif 'en' in self.loaded_layouts: target_vk_lang = 'en'; layout_exists = True
-                elif self.loaded_layouts: 
-                    target_vk_lang = next(iter(self.loaded_layouts)); layout_exists = True
-            
-            if not layout_exists: 
-                print(f"Error: No suitable visual layout found for system layout '{current_sys_name}' and no fallbacks loaded. Cannot update display.", file=sys.stderr)
-                target_vk_lang = 'us' 
+            if target_vk_lang not in self.loaded_layouts:
+                if self._default_fallback_layout is None: # us > en > first loaded; reset when layouts are reloaded
+                    self._default_fallback_layout = self._pick_initial_lang(None)
+                target_vk_lang = self._default_fallback_layout
+                if target_vk_lang not in self.loaded_layouts:
+                    print(f"Error: No suitable visual layout found for system layout '{current_sys_name}' and no fallbacks loaded. Cannot update display.", file=sys.stderr)
 
             if self.current_language != target_vk_lang:
                 print(f"Visual layout changing: {self.current_language} -> {target_vk_lang} (due to system: {current_sys_name})")
                 self.current_language = target_vk_lang
+                self.refresh_keycode_cache() # A new system layout may remap keys
                 self.update_key_labels() 
 
             if new_layout_name is None and self.xkb_manager.get_current_layout_name() != current_sys_name:
-                if current_sys_name in self.xkb_manager.get_available_layouts():
-                    try:
-                        sys_index = self.xkb_manager.get_available_layouts().index(current_sys_name)
-                        self.xkb_manager._set_internal_index(sys_index, emit_signal=False)
-                    except ValueError: 
-                        pass
+                sys_index = self.xkb_manager.index_of(current_sys_name) # O(1), rebuilt on refresh
+                if sys_index >= 0:
+                    self.xkb_manager._set_internal_index(sys_index, emit_signal=False)
                 else: 
                     print(f"Sync Warning: Queried system layout '{current_sys_name}' not in XKBManager's known list. Attempting refresh.", file=sys.stderr)
                     self.xkb_manager.refresh() 
+            self._last_seen_sys = current_sys_name
         else:
             print("WARNING: Could not query current system layout during sync.")
 
@@ -399,12 +560,11 @@ class VirtualKeyboard(QMainWindow):
                 self.layout_check_timer.stop()
             return
 
-        current_sys_name = self.xkb_manager.query_current_layout_name()
-        internal_xkb_name = self.xkb_manager.get_current_layout_name()
+        start_layout_query(self) # Query off the GUI thread; the result arrives in _on_layout_query_result
 
-        if current_sys_name and current_sys_name != internal_xkb_name:
-            print(f"Polling Timer: Detected system layout change ({internal_xkb_name} -> {current_sys_name}). Syncing VK...")
-            self.sync_vk_lang_with_system_slot() 
+    @pyqtSlot(object)
+    def _on_layout_query_result(self, current_sys_name: Optional[str]):
+        handle_layout_query_result(self, current_sys_name)
 
     def toggle_language(self):
         if self.repeating_key_name: 
@@ -420,22 +580,27 @@ class VirtualKeyboard(QMainWindow):
             next_idx = (idx + 1) % len(codes)
             self.current_language = codes[next_idx]
             self.update_key_labels()
-            QMessageBox.information(self, "Layout Info", "XKB Layout Manager unavailable. Cycled internal display only.")
+            self._notify("Layout Info", "XKB Layout Manager unavailable. Cycled internal display only.")
             return
 
         if len(self.xkb_manager.get_available_layouts()) <= 1:
-            QMessageBox.information(self, "Layout Info", "Only one system layout is configured.")
+            self._notify("Layout Info", "Only one system layout is configured.")
             self.sync_vk_lang_with_system_slot() 
             return
         
-        print("Toggling system language...")
+        log.info("Toggling system language...")
         if not self.xkb_manager.cycle_next_layout(): 
-            QMessageBox.warning(self, "Layout Switch Failed",
-                                f"'{self.xkb_manager.get_current_method()}' command to switch layout failed.")
+            self._notify("Layout Switch Failed",
+                         f"'{self.xkb_manager.get_current_method()}' command to switch layout failed.", critical=True)
         
         if not self.xkb_manager.can_monitor():
             QTimer.singleShot(100, self.sync_vk_lang_with_system_slot) 
 
+    @pyqtSlot()
+    def _on_language_action_triggered(self):
+        """Shared slot for the tray language actions; the layout code is the action's data()."""
+        self.set_system_language_from_menu(self.sender().data())
+
     def set_system_language_from_menu(self, lang_code: str):
         if self.repeating_key_name:
             self._handle_key_released(self.repeating_key_name, force_stop=True)
@@ -444,35 +609,17 @@ class VirtualKeyboard(QMainWindow):
             self._update_tray_status_display() 
             return
 
-        print(f"Tray Menu: Attempting to set system layout to '{lang_code}'...")
+        log.info("Tray Menu: Attempting to set system layout to '%s'...", lang_code)
         if not self.xkb_manager.set_layout_by_name(lang_code, update_system=True):
-            QMessageBox.warning(self, "Layout Switch Failed",
-                                f"Could not switch to '{lang_code}' using '{self.xkb_manager.get_current_method()}'.")
+            self._notify("Layout Switch Failed",
+                         f"Could not switch to '{lang_code}' using '{self.xkb_manager.get_current_method()}'.", critical=True)
         
         if not self.xkb_manager.can_monitor():
             QTimer.singleShot(100, self.sync_vk_lang_with_system_slot)
 
     def mousePressEvent(self, event):
-        if event.button() == Qt.MouseButton.MiddleButton:
-            if self.settings.get("auto_hide_on_middle_click", DEFAULT_SETTINGS.get("auto_hide_on_middle_click", True)):
-                self.hide_to_tray()
-                event.accept()
-                return
-        elif event.button() == Qt.MouseButton.RightButton:
-            target_widget = self.childAt(event.position().toPoint())
-            is_background_click = (target_widget is self or target_widget is self.central_widget or target_widget is None)
-            
-            if self.tray_menu and is_background_click:
-                self.monitor_was_running_for_context_menu = self._pause_focus_monitor_if_running()
-                
-                try: self.tray_menu.aboutToHide.disconnect(self._resume_monitor_after_context_menu)
-                except (TypeError, RuntimeError): pass 
-                self.tray_menu.aboutToHide.connect(self._resume_monitor_after_context_menu)
-
-                self.tray_menu.popup(event.globalPosition().toPoint())
-                event.accept()
-                return
-        elif event.button() == Qt.MouseButton.LeftButton:
+        pressed = event.button() # Read once; left presses (drag/resize) are checked first as the common case
+        if pressed is _LEFT_BUTTON:
             local_pos = event.position().toPoint()
             if self.is_frameless: 
                 self.resize_edge = self._get_resize_edge(local_pos)
@@ -480,25 +627,48 @@ class VirtualKeyboard(QMainWindow):
                     self.resizing = True
                     self.resize_start_pos = event.globalPosition().toPoint()
                     self.resize_start_geom = self.geometry()
+                    min_size = self.minimumSize() # Fixed for the whole drag; read once instead of per move
+                    self._resize_min_w = min_size.width(); self._resize_min_h = min_size.height()
                     self._update_cursor_shape(self.resize_edge)
-                    print(f"Starting frameless resize from edge: {self.resize_edge}")
+                    log.debug("Starting frameless resize from edge: %s", self.resize_edge)
                     event.accept()
                     return
-            
+
             target_widget = self.childAt(local_pos)
             is_button_click = isinstance(target_widget, QPushButton) if target_widget else False
             is_background_click = (target_widget is self.central_widget or target_widget is self or target_widget is None) and not is_button_click
 
             if is_background_click:
                 self.drag_position = event.globalPosition().toPoint() - self.frameGeometry().topLeft()
-                print("Starting window drag (Left Button on background)")
+                self._drag_offset_x = self.drag_position.x(); self._drag_offset_y = self.drag_position.y()
+                log.debug("Starting window drag (Left Button on background)")
+                event.accept()
+                return
+        elif pressed is _MIDDLE_BUTTON:
+            if self._auto_hide_on_middle_click:
+                self.hide_to_tray()
+                event.accept()
+                return
+        elif pressed is _RIGHT_BUTTON:
+            # Right presses on keys bubble up here too (keys handle them via their context menu signal)
+            target_widget = self.childAt(event.position().toPoint())
+            is_background_click = (target_widget is self or target_widget is self.central_widget or target_widget is None)
+
+            if self.tray_menu and is_background_click:
+                self.monitor_was_running_for_context_menu = self._pause_focus_monitor_if_running()
+                
+                try: self.tray_menu.aboutToHide.disconnect(self._resume_monitor_after_context_menu)
+                except (TypeError, RuntimeError): pass 
+                self.tray_menu.aboutToHide.connect(self._resume_monitor_after_context_menu)
+
+                self.tray_menu.popup(event.globalPosition().toPoint())
                 event.accept()
                 return
         
         super().mousePressEvent(event) 
 
     def _resume_monitor_after_context_menu(self):
-        print("Context menu closed.")
+        log.debug("Context menu closed.")
         try:
             if self.tray_menu: self.tray_menu.aboutToHide.disconnect(self._resume_monitor_after_context_menu)
         except (TypeError, RuntimeError): pass
@@ -508,35 +678,40 @@ class VirtualKeyboard(QMainWindow):
 
 
     def mouseMoveEvent(self, event):
+        if not (self.is_frameless or self.drag_position is not None or self.repeating_key_name):
+            super().mouseMoveEvent(event) # Framed, idle: nothing to drag, resize, hover or cancel
+            return
         if self.repeating_key_name and self.buttons.get(self.repeating_key_name):
             button_being_repeated = self.buttons[self.repeating_key_name]
             if not button_being_repeated.rect().contains(button_being_repeated.mapFromGlobal(event.globalPosition().toPoint())):
                 self._handle_key_released(self.repeating_key_name, force_stop=True) 
 
         if self.is_frameless and self.resizing and event.buttons() == Qt.MouseButton.LeftButton:
-            current_pos = event.globalPosition().toPoint()
-            delta = current_pos - self.resize_start_pos
-            new_geom = QRect(self.resize_start_geom) 
-
-            if self.resize_edge & EDGE_TOP: new_geom.setTop(self.resize_start_geom.top() + delta.y()) 
-            if self.resize_edge & EDGE_BOTTOM: new_geom.setBottom(self.resize_start_geom.bottom() + delta.y()) 
-            if self.resize_edge & EDGE_LEFT: new_geom.setLeft(self.resize_start_geom.left() + delta.x()) 
-            if self.resize_edge & EDGE_RIGHT: new_geom.setRight(self.resize_start_geom.right() + delta.x()) 
-            
-            min_w, min_h = self.minimumSize().width(), self.minimumSize().height()
-            if new_geom.width() < min_w:
-                if self.resize_edge & EDGE_LEFT: new_geom.setLeft(new_geom.right() - min_w) 
-                else: new_geom.setWidth(min_w)
-            if new_geom.height() < min_h:
-                if self.resize_edge & EDGE_TOP: new_geom.setTop(new_geom.bottom() - min_h) 
-                else: new_geom.setHeight(min_h)
-            
-            self.setGeometry(new_geom)
+            # Plain int math on the start geometry; no QRect per move
+            start = self.resize_start_geom; edge = self.resize_edge
+            delta = event.globalPosition().toPoint() - self.resize_start_pos
+            dx = delta.x(); dy = delta.y()
+            left = start.left() + dx if edge & EDGE_LEFT else start.left()
+            top = start.top() + dy if edge & EDGE_TOP else start.top()
+            right = start.right() + dx if edge & EDGE_RIGHT else start.right()
+            bottom = start.bottom() + dy if edge & EDGE_BOTTOM else start.bottom()
+
+            min_w = self._resize_min_w; min_h = self._resize_min_h
+            if right - left + 1 < min_w:
+                if edge & EDGE_LEFT: left = right - min_w + 1
+                else: right = left + min_w - 1
+            if bottom - top + 1 < min_h:
+                if edge & EDGE_TOP: top = bottom - min_h + 1
+                else: bottom = top + min_h - 1
+
+            self.setGeometry(left, top, right - left + 1, bottom - top + 1)
             event.accept()
             return
         elif self.drag_position is not None and event.buttons() == Qt.MouseButton.LeftButton:
-            new_pos = event.globalPosition().toPoint() - self.drag_position
-            self.move(new_pos)
+            pos = event.globalPosition() # QPointF; no QPoint conversion or QPoint arithmetic per move
+            self._pending_move = (int(pos.x()) - self._drag_offset_x, int(pos.y()) - self._drag_offset_y)
+            if not self._move_timer.isActive():
+                self._move_timer.start()
             event.accept()
             return
         elif self.is_frameless and not self.resizing and self.drag_position is None: 
@@ -547,6 +722,13 @@ class VirtualKeyboard(QMainWindow):
             super().mouseMoveEvent(event)
 
 
+    def _apply_pending_move(self):
+        pos = self._pending_move
+        self._pending_move = None
+        if pos is not None:
+            self.move(pos[0], pos[1])
+
+
     def mouseReleaseEvent(self, event):
         if self.repeating_key_name: 
             self._handle_key_released(self.repeating_key_name, force_stop=True)
@@ -557,12 +739,14 @@ class VirtualKeyboard(QMainWindow):
             self.resize_start_pos = None
             self.resize_start_geom = None
             self.unsetCursor() 
-            print("Frameless resize finished.")
+            log.debug("Frameless resize finished.")
             event.accept()
             return
         elif self.drag_position is not None and event.button() == Qt.MouseButton.LeftButton:
+            self._move_timer.stop()
+            self._apply_pending_move() # Land exactly on the final pointer position
             self.drag_position = None
-            print("Window drag finished.")
+            log.debug("Window drag finished.")
             event.accept()
             return
         elif self.is_frameless and not self.resizing and not event.buttons(): 
@@ -572,6 +756,26 @@ class VirtualKeyboard(QMainWindow):
             super().mouseReleaseEvent(event)
 
 
+    def changeEvent(self, event):
+        if event.type() == QEvent.Type.PaletteChange:
+            self._base_window_rgb = None # Theme changed; re-read the palette on the next style apply
+        super().changeEvent(event)
+
+    def hideEvent(self, event):
+        # No point polling the system layout while the keyboard is hidden (e.g. in the tray)
+        if self.layout_check_timer and self.layout_check_timer.isActive():
+            self.layout_check_timer.stop()
+        super().hideEvent(event)
+
+    def showEvent(self, event):
+        if self._labels_dirty:
+            self._labels_dirty = False
+            self._do_update_key_labels() # Before the first paint, so stale labels never show
+        super().showEvent(event)
+        if self.layout_check_timer and not self.layout_check_timer.isActive():
+            self.layout_check_timer.start(LAYOUT_POLL_INTERVAL_MS)
+            QTimer.singleShot(0, self.check_system_layout_timer_slot) # Catch up on changes made while hidden
+
     def closeEvent(self, event):
         if self.tray_icon and self.tray_icon.isVisible():
             event.ignore() 
@@ -587,6 +791,7 @@ class VirtualKeyboard(QMainWindow):
             self.xkb_manager.stop_change_monitor()
         elif self.layout_check_timer and self.layout_check_timer.isActive():
             self.layout_check_timer.stop()
+        stop_xkb_event_notifier(self)
         
         if hasattr(self, 'initial_delay_timer'): self.initial_delay_timer.stop()
         if hasattr(self, 'auto_repeat_timer'): self.auto_repeat_timer.stop()
@@ -597,7 +802,7 @@ class VirtualKeyboard(QMainWindow):
             except Exception as e:
                 print(f"Error stopping AT-SPI focus monitor during quit: {e}")
 
-        if self.settings.get("remember_geometry", DEFAULT_SETTINGS.get("remember_geometry", True)):
+        if self._remember_geometry:
             try:
                 if not self.isMinimized(): 
                     self.settings["window_geometry"] = {
@@ -616,6 +821,7 @@ class VirtualKeyboard(QMainWindow):
             self.tray_icon.hide() 
             self.tray_icon.deleteLater() 
 
+        uinput_int.close_uinput()
         xlib_int.close_xlib() 
         print("PyXKeyboard application quitting.")
         
@@ -88,7 +88,7 @@ def _handle_key_pressed_simulation(vk_instance, key_name):
     Handles the initial press of a potentially repeating key.
     Simulates the first key event, then starts auto-repeat if enabled.
     """
-    from .key_definitions import FALLBACK_CHAR_MAP # Local import to avoid cycle at module level
+    from .key_definitions import FALLBACK_CHAR_MAP, MOD_SHIFT, MOD_CTRL, MOD_ALT, MOD_CAPS # Local import to avoid cycle at module level
 
     # If another key is already repeating, stop it
     if vk_instance.repeating_key_name and vk_instance.repeating_key_name != key_name:
@@ -102,16 +102,9 @@ def _handle_key_pressed_simulation(vk_instance, key_name):
     should_release_sticky_mods = key_name in FALLBACK_CHAR_MAP or key_name == 'Space'
 
     released_mods = False
-    if sim_ok and should_release_sticky_mods:
-        if vk_instance.shift_pressed:
-            vk_instance.shift_pressed = False
-            released_mods = True
-        if vk_instance.ctrl_pressed:
-            vk_instance.ctrl_pressed = False
-            released_mods = True
-        if vk_instance.alt_pressed:
-            vk_instance.alt_pressed = False
-            released_mods = True
+    if sim_ok and should_release_sticky_mods and vk_instance._mod_state & (MOD_SHIFT | MOD_CTRL | MOD_ALT):
+        vk_instance._mod_state &= MOD_CAPS # Caps Lock is a lock, not a one-shot modifier
+        released_mods = True
 
     if released_mods:
         vk_instance.update_key_labels() # Update labels if modifiers changed
@@ -3,20 +3,31 @@
 # PyXKeyboard v1.0.7 - Key Simulation Logic for VirtualKeyboard
 # Developed by Khaled Abdelhamid (khaled1512@gmail.com) - Licensed under GPLv3.
 
+import logging
+
 try:
-    from PyQt6.QtWidgets import QMessageBox
     from PyQt6.QtCore import QTimer
 except ImportError:
     print("ERROR: PyQt6 library is required for vk_key_simulation.")
     raise
 
 from . import xlib_integration as xlib_int
+from . import uinput_integration as uinput_int
 from .xlib_integration import X as X_CONST # For X.KeyPress, X.KeyRelease
-from .key_definitions import X11_KEYSYM_MAP, FALLBACK_CHAR_MAP
+from .key_definitions import (
+    X11_KEYSYM_MAP, FALLBACK_CHAR_MAP, SHIFT_KEYS, CTRL_KEYS, ALT_KEYS, LETTER_KEYS,
+    MOD_SHIFT, MOD_CTRL, MOD_ALT, MOD_CAPS, MOD_CAPS_SHIFT
+)
 from .settings_manager import DEFAULT_SETTINGS
 # Import auto-repeat handlers that are now part of this module's responsibility (or called from here)
 from .vk_auto_repeat import handle_key_pressed_for_repeat, handle_key_released_for_repeat
 
+# Key paths log through logging: messages below the active level cost no formatting or stdout write
+log = logging.getLogger(__name__)
+
+_SUPER_KEYS = frozenset({'L Win', 'R Win', 'App'}) # Sent without Shift; release every sticky modifier
+_SHIFT_STATE_KEYS = SHIFT_KEYS | {'Caps Lock'} # Keep sticky Ctrl/Alt when pressed as non-repeatable keys
+
 
 # --- Key Simulation and Modifier Handling ---
 
@@ -28,22 +39,22 @@ def on_modifier_key_press(vk_instance, key_name):
 
 
     mod_changed = False
-    if key_name in ['LShift', 'RShift']:
+    if key_name in SHIFT_KEYS:
         vk_instance.shift_pressed = not vk_instance.shift_pressed
         mod_changed = True
-    elif key_name in ['L Ctrl', 'R Ctrl']:
+    elif key_name in CTRL_KEYS:
         vk_instance.ctrl_pressed = not vk_instance.ctrl_pressed
         mod_changed = True
-    elif key_name in ['L Alt', 'R Alt']:
+    elif key_name in ALT_KEYS:
         vk_instance.alt_pressed = not vk_instance.alt_pressed
         mod_changed = True
     elif key_name == 'Caps Lock':
-        # Simulate Caps Lock toggle at XTEST level
+        # Simulate Caps Lock toggle through the key backend
         sim_success = _send_xtest_key_event(vk_instance, key_name, False, is_caps_toggle=True)
         if sim_success:
             vk_instance.caps_lock_pressed = not vk_instance.caps_lock_pressed
         else:
-            QMessageBox.warning(vk_instance, "Caps Lock Error", "Could not toggle system Caps Lock.")
+            vk_instance._notify("Caps Lock Error", "Could not toggle system Caps Lock.", critical=True)
         mod_changed = True
 
     if mod_changed:
@@ -58,26 +69,22 @@ def on_non_repeatable_key_press(vk_instance, key_name):
     # For Win/App keys, Shift/Ctrl/Alt are usually not combined by OSK, so simulate_shift=False
     # For F-keys, Esc etc., they might be combined with Ctrl/Alt/Shift by user intent
     # So, we need to check current sticky modifier states for these.
-    effective_shift = vk_instance.shift_pressed if key_name not in ['L Win', 'R Win', 'App'] else False
+    effective_shift = vk_instance.shift_pressed if key_name not in _SUPER_KEYS else False
 
     sim_ok = _send_xtest_key_event(vk_instance, key_name, simulate_shift=effective_shift)
 
     released_mods = False
     if sim_ok:
-        # For Win/Super and App keys, they typically release other sticky modifiers.
-        if key_name in ['L Win', 'R Win', 'App']:
-            if vk_instance.ctrl_pressed:
-                vk_instance.ctrl_pressed = False; released_mods = True
-            if vk_instance.alt_pressed:
-                vk_instance.alt_pressed = False; released_mods = True
-            if vk_instance.shift_pressed: # Also release shift for these special keys
-                vk_instance.shift_pressed = False; released_mods = True
+        # For Win/Super and App keys, they typically release other sticky modifiers (Shift included).
+        if key_name in _SUPER_KEYS:
+            release_mask = MOD_SHIFT | MOD_CTRL | MOD_ALT
         # For other non-repeatable (like F-keys), if sticky Ctrl/Alt were used, release them. Shift state is maintained.
-        elif key_name not in ['LShift', 'RShift', 'Caps Lock']: # Don't auto-release Shift for F-keys etc.
-            if vk_instance.ctrl_pressed:
-                 vk_instance.ctrl_pressed = False; released_mods = True
-            if vk_instance.alt_pressed:
-                 vk_instance.alt_pressed = False; released_mods = True
+        elif key_name not in _SHIFT_STATE_KEYS: # Don't auto-release Shift for F-keys etc.
+            release_mask = MOD_CTRL | MOD_ALT
+        else:
+            release_mask = 0
+        if vk_instance._mod_state & release_mask:
+            vk_instance._mod_state &= ~release_mask; released_mods = True
 
 
     if released_mods:
@@ -88,116 +95,156 @@ def _simulate_single_key_press_event(vk_instance, key_name):
     """Simulates a single press-and-release for a given key name, respecting modifiers."""
     if not key_name: return False
 
-    is_letter = key_name.isalpha() and len(key_name) == 1
-
-    # For arrow keys, Shift is a direct modifier. For letters, it interacts with Caps Lock.
-    if key_name in ['Up', 'Down', 'Left', 'Right', 'Home', 'End', 'Page Up', 'Page Down', 'Insert', 'Delete']:
-        effective_shift_for_simulation = vk_instance.shift_pressed
-    else: # For typable characters, Tab, Enter, Backspace, Space, Esc, F-keys
-        effective_shift_for_simulation = (vk_instance.shift_pressed ^ vk_instance.caps_lock_pressed) if is_letter else vk_instance.shift_pressed
+    state = vk_instance._mod_state
+    # Shift is a direct modifier for everything except single letters, where it is XORed with Caps Lock
+    if key_name in LETTER_KEYS:
+        state ^= state >> MOD_CAPS_SHIFT
+    effective_shift_for_simulation = bool(state & MOD_SHIFT)
     
     sim_ok = _send_xtest_key_event(vk_instance, key_name, effective_shift_for_simulation)
     return sim_ok
 
 
 def _send_xtest_key_event(vk_instance, key_name, simulate_shift, is_caps_toggle=False):
-    """ Sends the low-level XTEST key event sequence. """
-    caps_kc = xlib_int.get_caps_lock_keycode()
-    shift_kc = xlib_int.get_shift_keycode()
-    ctrl_kc = xlib_int.get_ctrl_keycode()
-    alt_kc = xlib_int.get_alt_keycode()
+    """ Sends the low-level key event sequence through the active backend (XTEST or uinput). """
+    shift_kc, ctrl_kc, alt_kc, caps_kc = vk_instance.modifier_keycodes # Cached by refresh_keycode_cache
+    send_nosync, flush = vk_instance.key_event_backend # Chosen once by init_input_backend
 
     if is_caps_toggle:
-        if not xlib_int.is_xtest_ok() or not caps_kc:
-            print("XTEST Error: Cannot toggle Caps Lock (XTEST not OK or no CapsLock keycode).")
+        if not _is_key_backend_ok(vk_instance) or not caps_kc:
+            log.warning("%s Error: Cannot toggle Caps Lock (backend not OK or no CapsLock keycode).", vk_instance.key_event_backend_name)
             return False
-        ok = xlib_int.send_xtest_event(X_CONST.KeyPress, caps_kc) and \
-             xlib_int.send_xtest_event(X_CONST.KeyRelease, caps_kc)
+        ok = send_nosync(X_CONST.KeyPress, caps_kc) and \
+             send_nosync(X_CONST.KeyRelease, caps_kc) and \
+             flush()
         if not ok:
-            _handle_xtest_error_simulation(vk_instance)
+            _handle_key_backend_error(vk_instance)
         return ok
 
-    if not xlib_int.is_xtest_ok():
-        return False # XTEST not available or failed initialization
+    if not _is_key_backend_ok(vk_instance):
+        return False # Backend not available or failed initialization
 
-    keysym = X11_KEYSYM_MAP.get(key_name)
-    if keysym is None or keysym == 0: # 0 is NoSymbol
-        print(f"Warning: No (or invalid) X11 KeySym defined for '{key_name}'. Cannot simulate.")
+    keycodes_by_name = vk_instance.keycodes_by_name # Resolved once per keymap by refresh_keycode_cache
+    if key_name not in keycodes_by_name:
+        log.warning("No (or invalid) X11 KeySym defined for '%s'. Cannot simulate.", key_name)
         return False
 
-    keycode = xlib_int.keysym_to_keycode(keysym)
-    if not keycode: # If keysym_to_keycode returns None (or 0, which it treats as None)
-        print(f"WARNING: No KeyCode found for KeySym {hex(keysym)} ('{key_name}'). Cannot simulate.")
+    keycode = keycodes_by_name[key_name]
+    if not keycode: # keysym_to_keycode found nothing for this keysym
+        log.warning("No KeyCode found for KeySym %#x ('%s'). Cannot simulate.", X11_KEYSYM_MAP[key_name], key_name)
+        return False
+
+    state = vk_instance._mod_state
+    if not (simulate_shift or state & (MOD_CTRL | MOD_ALT)):
+        # Plain key (the common case): press, release and one flush, no modifier bookkeeping
+        if send_nosync(X_CONST.KeyPress, keycode) and send_nosync(X_CONST.KeyRelease, keycode) and flush():
+            return True
+        log.error("Error during %s sequence for '%s': plain key press/release failed", vk_instance.key_event_backend_name, key_name)
+        _handle_key_backend_error(vk_instance, critical=True)
+        try:
+            send_nosync(X_CONST.KeyRelease, keycode); flush() # Never leave the key stuck down
+        except Exception:
+            pass
         return False
 
-    # Determine which modifiers need to be pressed for this event
-    press_shift_for_event = simulate_shift and shift_kc
-    press_ctrl_for_event = vk_instance.ctrl_pressed and ctrl_kc
-    press_alt_for_event = vk_instance.alt_pressed and alt_kc
+    # Determine which modifiers need to be pressed for this event (pressed in this order, released in reverse)
+    press_order = [kc for kc in (ctrl_kc if state & MOD_CTRL else None,
+                                 alt_kc if state & MOD_ALT else None,
+                                 shift_kc if simulate_shift else None) if kc]
+    press_order.append(keycode)
 
-    all_ok = True
+    held = [] # Keycodes whose press was queued and whose release was not
     try:
-        # Press modifiers
-        if press_ctrl_for_event: all_ok &= xlib_int.send_xtest_event(X_CONST.KeyPress, ctrl_kc)
-        if press_alt_for_event: all_ok &= xlib_int.send_xtest_event(X_CONST.KeyPress, alt_kc)
-        if press_shift_for_event: all_ok &= xlib_int.send_xtest_event(X_CONST.KeyPress, shift_kc)
-        if not all_ok: raise Exception("Modifier Press Failure")
-
-        # Press and release the main key
-        all_ok &= xlib_int.send_xtest_event(X_CONST.KeyPress, keycode)
-        all_ok &= xlib_int.send_xtest_event(X_CONST.KeyRelease, keycode)
-        if not all_ok: raise Exception("Main Key Press/Release Failure")
-
-        # Release modifiers (in reverse order of press ideally, though often not critical for XTEST)
-        if press_shift_for_event: all_ok &= xlib_int.send_xtest_event(X_CONST.KeyRelease, shift_kc)
-        if press_alt_for_event: all_ok &= xlib_int.send_xtest_event(X_CONST.KeyRelease, alt_kc)
-        if press_ctrl_for_event: all_ok &= xlib_int.send_xtest_event(X_CONST.KeyRelease, ctrl_kc)
-        if not all_ok: raise Exception("Modifier Release Failure")
+        for kc in press_order:
+            if not send_nosync(X_CONST.KeyPress, kc): raise Exception("Key Press Failure")
+            held.append(kc)
+
+        # Release the main key first, then the modifiers in reverse order of press
+        while held:
+            if not send_nosync(X_CONST.KeyRelease, held[-1]): raise Exception("Key Release Failure")
+            held.pop()
+
+        # The whole sequence above was only queued; send it to the server in one go
+        if not flush(): raise Exception("Display Flush Failure")
 
         return True
 
     except Exception as e:
-        print(f"ERROR during XTEST sequence for '{key_name}': {e}")
-        _handle_xtest_error_simulation(vk_instance, critical=True) # Assume critical if sequence fails
-        # Attempt to clean up any pressed modifiers if an error occurred mid-sequence
+        log.error("Error during %s sequence for '%s': %s", vk_instance.key_event_backend_name, key_name, e)
+        _handle_key_backend_error(vk_instance, critical=True) # Assume critical if sequence fails
+        # Release only what this sequence actually pressed, so no key is left stuck
         try:
-            # Use the actual state of whether they were pressed for *this event*
-            if press_shift_for_event and xlib_int.is_xtest_ok() and shift_kc:
-                xlib_int.send_xtest_event(X_CONST.KeyRelease, shift_kc)
-            if press_alt_for_event and xlib_int.is_xtest_ok() and alt_kc:
-                xlib_int.send_xtest_event(X_CONST.KeyRelease, alt_kc)
-            if press_ctrl_for_event and xlib_int.is_xtest_ok() and ctrl_kc:
-                xlib_int.send_xtest_event(X_CONST.KeyRelease, ctrl_kc)
-            if xlib_int.is_xtest_ok():
-                 xlib_int.flush_display()
+            for kc in reversed(held):
+                send_nosync(X_CONST.KeyRelease, kc)
+            if held:
+                flush()
         except Exception:
             pass # Avoid error during cleanup
         return False
 
 
-def _handle_xtest_error_simulation(vk_instance, critical=False):
-    """Handles XTEST errors, potentially disabling XTEST and notifying user."""
-    if xlib_int.is_xtest_ok(): # Only act if it was previously considered OK
+def refresh_keycode_cache(vk_instance):
+    """
+    Caches the (Shift, Ctrl, Alt, Caps Lock) keycodes and the keycode of every key in
+    X11_KEYSYM_MAP, so XTEST key sequences need no keysym lookups. Call again when the keymap changes.
+    """
+    vk_instance.modifier_keycodes = (
+        xlib_int.get_shift_keycode(), xlib_int.get_ctrl_keycode(),
+        xlib_int.get_alt_keycode(), xlib_int.get_caps_lock_keycode()
+    )
+    vk_instance.keycodes_by_name = {
+        name: xlib_int.keysym_to_keycode(keysym)
+        for name, keysym in X11_KEYSYM_MAP.items() if keysym # 0 is NoSymbol
+    }
+
+
+def init_input_backend(vk_instance):
+    """
+    Selects how key events are injected: XTEST by default, or kernel uinput (one write() per
+    key sequence, no X round trip) when the use_uinput_backend setting is on and /dev/uinput
+    is writable. Keysyms are still resolved to keycodes through the X keymap in both cases.
+    """
+    use_uinput = vk_instance.settings.get("use_uinput_backend", DEFAULT_SETTINGS.get("use_uinput_backend", False))
+    if use_uinput and uinput_int.initialize_uinput():
+        vk_instance.key_event_backend = (uinput_int.send_uinput_key_nosync, uinput_int.flush_uinput)
+        vk_instance.key_event_backend_name = "uinput"
+    else:
+        vk_instance.key_event_backend = (xlib_int.send_xtest_event_nosync, xlib_int.flush_display)
+        vk_instance.key_event_backend_name = "XTEST"
+    print(f"Key simulation backend: {vk_instance.key_event_backend_name}")
+
+
+def _is_key_backend_ok(vk_instance):
+    """ Returns True if the active key backend is usable (uinput needs its device, XTEST its display). """
+    if vk_instance.key_event_backend_name == "uinput":
+        return uinput_int.is_uinput_ok()
+    return xlib_int.is_xtest_ok()
+
+
+def _handle_key_backend_error(vk_instance, critical=False):
+    """Handles key backend (XTEST or uinput) errors and notifies the user."""
+    backend_name = vk_instance.key_event_backend_name
+    if _is_key_backend_ok(vk_instance): # Only act if it was previously considered OK
         # To actually disable, the flag in xlib_integration should be set.
         # This function mostly handles the GUI feedback part.
         # xlib_int._xlib_ok = False # Let xlib_integration manage its own state.
-        print("XTEST operation failed. Subsequent XTEST calls might also fail.")
-        if xlib_int.get_display(): # Check if display object exists before flushing
+        log.error("%s operation failed. Subsequent %s calls might also fail.", backend_name, backend_name)
+        if backend_name == "XTEST" and xlib_int.get_display(): # Check if display object exists before flushing
             xlib_int.flush_display() 
         
-        msg_title = "XTEST Error"
+        msg_title = f"{backend_name} Error"
         msg_text = "A key simulation error occurred."
         if critical:
-            msg_text += "\nXTEST (key input) functionality might be compromised."
+            msg_text += f"\n{backend_name} (key input) functionality might be compromised."
         
-        QMessageBox.warning(vk_instance, msg_title, msg_text)
+        vk_instance._notify(msg_title, msg_text, critical=True)
         vk_instance.xlib_ok = xlib_int.is_xtest_ok() # Re-check status from xlib_int
-        vk_instance.init_tray_icon() # Update tray icon tooltip if status changes
+        vk_instance._update_tray_status_display() # Update tray icon tooltip if status changes
 
 
 def on_typable_key_right_press(vk_instance, key_name):
     """ Handles right-click on typable keys: Simulates Shift + Key and flashes button. """
-    print(f"Right-click detected on typable key: {key_name}")
+    log.debug("Right-click detected on typable key: %s", key_name)
     if vk_instance.repeating_key_name:
         _handle_key_released_simulation(vk_instance, vk_instance.repeating_key_name, force_stop=True)
 
@@ -219,15 +266,12 @@ def on_typable_key_right_press(vk_instance, key_name):
 
     # Simulate Shift + Key press. Ctrl/Alt are NOT applied with right-click shift.
     # Store current Ctrl/Alt state, simulate, then restore.
-    temp_ctrl_pressed = vk_instance.ctrl_pressed
-    temp_alt_pressed = vk_instance.alt_pressed
-    vk_instance.ctrl_pressed = False
-    vk_instance.alt_pressed = False
+    saved_mod_state = vk_instance._mod_state
+    vk_instance._mod_state = saved_mod_state & ~(MOD_CTRL | MOD_ALT)
 
     sim_ok = _send_xtest_key_event(vk_instance, key_name, simulate_shift=True)
 
-    vk_instance.ctrl_pressed = temp_ctrl_pressed # Restore Ctrl
-    vk_instance.alt_pressed = temp_alt_pressed   # Restore Alt
+    vk_instance._mod_state = saved_mod_state # Restore Ctrl/Alt
 
 
     original_stylesheet = button.styleSheet() # Save original style for restoring
@@ -239,7 +283,7 @@ def on_typable_key_right_press(vk_instance, key_name):
             # Restore after a delay
             QTimer.singleShot(300, lambda: vk_instance._revert_button_flash(button, original_stylesheet))
         except Exception as e:
-            print(f"Error flashing button for right-click: {e}")
+            log.error("Error flashing button for right-click: %s", e)
             vk_instance._revert_button_flash(button, original_stylesheet) # Ensure revert on error
 
     # Right-click shift should release any *other* sticky modifiers like Ctrl, Alt,
@@ -247,11 +291,8 @@ def on_typable_key_right_press(vk_instance, key_name):
     # The Shift state of the keyboard (vk_instance.shift_pressed) should remain unchanged
     # by a right-click action itself.
     released_other_mods = False
-    if sim_ok: # If simulation was successful
-        if vk_instance.ctrl_pressed:
-            vk_instance.ctrl_pressed = False; released_other_mods = True
-        if vk_instance.alt_pressed:
-            vk_instance.alt_pressed = False; released_other_mods = True
+    if sim_ok and saved_mod_state & (MOD_CTRL | MOD_ALT): # If simulation was successful
+        vk_instance._mod_state = saved_mod_state & ~(MOD_CTRL | MOD_ALT); released_other_mods = True
     
     if released_other_mods:
         # Delay label update slightly to allow flash to be visible
@@ -275,16 +316,9 @@ def _handle_key_pressed_simulation(vk_instance, key_name):
     should_release_sticky_mods = key_name in FALLBACK_CHAR_MAP or key_name == 'Space'
 
     released_mods = False
-    if sim_ok and should_release_sticky_mods:
-        if vk_instance.shift_pressed:
-            vk_instance.shift_pressed = False
-            released_mods = True
-        if vk_instance.ctrl_pressed:
-            vk_instance.ctrl_pressed = False
-            released_mods = True
-        if vk_instance.alt_pressed:
-            vk_instance.alt_pressed = False
-            released_mods = True
+    if sim_ok and should_release_sticky_mods and vk_instance._mod_state & (MOD_SHIFT | MOD_CTRL | MOD_ALT):
+        vk_instance._mod_state &= MOD_CAPS # Caps Lock is a lock, not a one-shot modifier
+        released_mods = True
 
     if released_mods:
         vk_instance.update_key_labels() # Update labels if modifiers changed
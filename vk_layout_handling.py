@@ -4,26 +4,84 @@
 # Developed by Khaled Abdelhamid (khaled1512@gmail.com) - Licensed under GPLv3.
 
 import os
+import sys
 import json
+import marshal
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from collections import namedtuple
+from collections.abc import Mapping
 from typing import Optional, Dict, List, Union
 
 try:
     from PyQt6.QtWidgets import QMessageBox
-    from PyQt6.QtCore import QTimer, Qt
+    from PyQt6.QtCore import QTimer, Qt, QSocketNotifier, QRunnable, QThreadPool
 except ImportError:
     print("ERROR: PyQt6 library is required for vk_layout_handling.")
     raise
 
 from .XKB_Switcher import XKBManager, XKBManagerError
-from .key_definitions import FALLBACK_CHAR_MAP
-
+from . import xlib_integration as xlib_int
+from .settings_manager import SETTINGS_DIR
+from .vk_ui import set_modifier_visual
+from .key_definitions import (
+    FALLBACK_CHAR_MAP, KEY_DISPLAY_SYMBOLS, SHIFT_KEYS, CTRL_KEYS, ALT_KEYS, LETTER_KEYS,
+    MOD_SHIFT, MOD_CTRL, MOD_ALT, MOD_CAPS, MOD_CAPS_SHIFT
+)
+
+# Optional faster JSON decoder for layout files (orjson takes bytes; its errors subclass json.JSONDecodeError)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
-def init_xkb_manager_and_layouts(vk_instance):
-    """Initializes the XKBManager, loads corresponding layouts, and starts monitoring/timer."""
+# Optional compiled validator for layout files; the manual isinstance checks are used without it
+try:
+    import fastjsonschema
+    _LAYOUT_VALIDATOR = fastjsonschema.compile({
+        "type": "object",
+        "additionalProperties": {
+            "type": "array", "minItems": 1, "maxItems": 2,
+            "items": [{"type": "string"}, {"type": ["string", "null"]}],
+        },
+    })
+except ImportError:
+    fastjsonschema = None
+    _LAYOUT_VALIDATOR = None
+
+LAYOUT_POLL_INTERVAL_MS = 1000 # Fallback polling period when xkb-switch monitoring is unavailable
+# Validated layouts keyed by file mtime. marshal only encodes plain data (nothing runs on load, unlike pickle)
+LAYOUTS_CACHE_FILE = os.path.join(SETTINGS_DIR, "layouts_cache.marshal")
+_LAYOUTS_CACHE_VERSION = 2 # Bump when the cached structure or the validation rules change
+_FALLBACK_LAYOUT_CODES = ('us', 'en')
+_prefetch_executor: Optional[ThreadPoolExecutor] = None # Created on first use (see LayoutRegistry.start_prefetch)
+
+
+class _LayoutQueryTask(QRunnable):
+    """Runs XKBManager.query_current_layout_name (a subprocess call) on a QThreadPool worker."""
+    def __init__(self, xkb_manager, result_signal):
+        super().__init__()
+        self._xkb_manager = xkb_manager
+        self._result_signal = result_signal
+
+    def run(self):
+        try:
+            current_sys_name = self._xkb_manager.query_current_layout_name()
+        except Exception as e:
+            print(f"Error querying system layout: {e}", file=sys.stderr)
+            current_sys_name = None
+        self._result_signal.emit(current_sys_name) # Queued back to the GUI thread
+
+
+def init_xkb_manager_and_layouts(vk_instance, start_monitoring: bool = True):
+    """Initializes the XKBManager, loads corresponding layouts, and starts monitoring/timer.
+    With start_monitoring=False the caller starts it later via start_layout_change_monitoring."""
     vk_instance.xkb_manager = None # Reset
     if vk_instance.layout_check_timer and vk_instance.layout_check_timer.isActive():
         vk_instance.layout_check_timer.stop()
     vk_instance.layout_check_timer = None
+    stop_xkb_event_notifier(vk_instance)
 
     system_layouts = []
     try:
@@ -38,19 +96,12 @@ def init_xkb_manager_and_layouts(vk_instance):
 
             # Connect signal for layout changes
             vk_instance.xkb_manager.layoutChanged.connect(
-                vk_instance.sync_vk_lang_with_system_slot,
+                vk_instance._queue_system_layout_sync, # Coalesces bursts, then calls sync_vk_lang_with_system_slot
                 Qt.ConnectionType.QueuedConnection
             )
 
-            # Start monitoring if possible, otherwise use a timer
-            if vk_instance.xkb_manager.can_monitor():
-                print("Starting xkb-switch monitoring for layout changes...")
-                vk_instance.xkb_manager.start_change_monitor()
-            else:
-                print("xkb-switch monitoring not available or failed, starting fallback polling timer...")
-                vk_instance.layout_check_timer = QTimer(vk_instance)
-                vk_instance.layout_check_timer.timeout.connect(vk_instance.check_system_layout_timer_slot)
-                vk_instance.layout_check_timer.start(1000) # Check every second
+            if start_monitoring:
+                start_layout_change_monitoring(vk_instance)
         else:
             print("XKB Manager could not be initialized with any method. Loading default layouts only.")
             load_layout_files_from_system_config(vk_instance, ['us', 'en', 'ar']) # Load common fallbacks
@@ -64,44 +115,284 @@ def init_xkb_manager_and_layouts(vk_instance):
         vk_instance.current_language = 'us'
 
 
+def start_layout_change_monitoring(vk_instance):
+    """Starts xkb-switch monitoring if possible, else the XKB event notifier, else the polling timer."""
+    if not vk_instance.xkb_manager or vk_instance.xkb_manager.get_current_method() == XKBManager.METHOD_NONE:
+        return
+    if vk_instance.xkb_manager.can_monitor():
+        print("Starting xkb-switch monitoring for layout changes...")
+        vk_instance.xkb_manager.start_change_monitor()
+    elif start_xkb_event_notifier(vk_instance):
+        print("xkb-switch monitoring not available, listening for XKB group change events...")
+    else:
+        print("xkb-switch monitoring not available or failed, starting fallback polling timer...")
+        start_layout_poll_timer(vk_instance)
+
+
+def start_layout_poll_timer(vk_instance):
+    """Starts the periodic system layout check (last resort when no change events are available)."""
+    vk_instance.layout_check_timer = QTimer(vk_instance)
+    # Queued so a check that pumps events (e.g. via a sync dialog) can never re-enter itself
+    vk_instance.layout_check_timer.timeout.connect(
+        vk_instance.check_system_layout_timer_slot,
+        Qt.ConnectionType.QueuedConnection
+    )
+    vk_instance.layout_check_timer.start(LAYOUT_POLL_INTERVAL_MS)
+
+
+def start_layout_query(vk_instance):
+    """Starts a background system layout query unless one is already running."""
+    if vk_instance._layout_query_in_flight or not vk_instance.xkb_manager:
+        return
+    vk_instance._layout_query_in_flight = True
+    QThreadPool.globalInstance().start(_LayoutQueryTask(vk_instance.xkb_manager, vk_instance.layoutQueryFinished))
+
+
+def handle_layout_query_result(vk_instance, current_sys_name: Optional[str]):
+    """Applies a background layout query result; runs on the GUI thread."""
+    vk_instance._layout_query_in_flight = False
+    if not vk_instance.xkb_manager:
+        return
+    internal_xkb_name = vk_instance.xkb_manager.get_current_layout_name()
+    if current_sys_name and current_sys_name != internal_xkb_name:
+        print(f"Polling Timer: Detected system layout change ({internal_xkb_name} -> {current_sys_name}). Syncing VK...")
+        sys_index = vk_instance.xkb_manager.index_of(current_sys_name)
+        if sys_index >= 0:
+            # Emits layoutChanged, which syncs the VK with the already-known name (no second query)
+            vk_instance.xkb_manager._set_internal_index(sys_index, emit_signal=True)
+        else:
+            vk_instance.sync_vk_lang_with_system_slot() # Unknown layout; the full sync refreshes the list
+
+
+def start_xkb_event_notifier(vk_instance) -> bool:
+    """Watches a dedicated X connection for XKB group changes from the Qt event loop."""
+    result = xlib_int.open_xkb_group_event_display()
+    if not result:
+        return False
+    vk_instance.xkb_event_display, vk_instance.xkb_event_code = result
+    vk_instance.xkb_event_notifier = QSocketNotifier(
+        vk_instance.xkb_event_display.fileno(), QSocketNotifier.Type.Read, vk_instance
+    )
+    vk_instance.xkb_event_notifier.activated.connect(lambda *args: handle_xkb_event_notifier_activity(vk_instance))
+    return True
+
+
+def stop_xkb_event_notifier(vk_instance):
+    """Disables the XKB event notifier and closes its X connection."""
+    if vk_instance.xkb_event_notifier:
+        vk_instance.xkb_event_notifier.setEnabled(False)
+        vk_instance.xkb_event_notifier.deleteLater()
+        vk_instance.xkb_event_notifier = None
+    if vk_instance.xkb_event_display:
+        try: vk_instance.xkb_event_display.close()
+        except Exception: pass
+        vk_instance.xkb_event_display = None
+
+
+def handle_xkb_event_notifier_activity(vk_instance):
+    """Drains pending XKB events and syncs the VK layout from the reported group."""
+    connection_ok, group, keymap_changed = xlib_int.drain_xkb_group_events(vk_instance.xkb_event_display, vk_instance.xkb_event_code)
+    if keymap_changed: # XKB map/new-keyboard notify (e.g. setxkbmap); the X keymap was already reloaded
+        vk_instance.refresh_keycode_cache()
+        print("Keyboard mapping changed: keycode cache refreshed.")
+    if not connection_ok:
+        print("XKB event connection lost, falling back to polling timer.", file=sys.stderr)
+        stop_xkb_event_notifier(vk_instance)
+        start_layout_poll_timer(vk_instance)
+    elif group is not None and vk_instance.xkb_manager:
+        if group < len(vk_instance.xkb_manager.get_available_layouts()):
+            # Group index follows the configured layout order; emits layoutChanged only on a real change
+            vk_instance.xkb_manager._set_internal_index(group, emit_signal=True)
+        else:
+            vk_instance.check_system_layout_timer_slot() # Layout list is stale; query and refresh
+
+
 def load_layout_files_from_system_config(vk_instance, required_layout_codes: List[str]):
-    """Loads required .json layout files from the layouts directory."""
-    print(f"Loading required layouts ({required_layout_codes}) from: {vk_instance.layouts_dir}")
+    """Registers the .json layout files for the required codes; each file is parsed on first use."""
+    print(f"Registering required layouts ({required_layout_codes}) from: {vk_instance.layouts_dir}")
     if not os.path.isdir(vk_instance.layouts_dir):
         print(f"Warning: Layouts directory not found: {vk_instance.layouts_dir}")
         return
 
-    vk_instance.loaded_layouts = {} # Clear previous layouts
-
-    fallback_codes_to_try = ['us', 'en']
-    loaded_fallback_code = None
-    for code in fallback_codes_to_try:
-        filepath = os.path.join(vk_instance.layouts_dir, f"{code}.json")
-        if os.path.exists(filepath):
-            if load_single_layout_file_into_instance(vk_instance, code, filepath):
-                loaded_fallback_code = code
-                break 
-
-    if not loaded_fallback_code and not FALLBACK_CHAR_MAP: 
-        print("ERROR: No fallback layout (us.json/en.json) found and FALLBACK_CHAR_MAP is empty!", file=sys.stderr)
-
-    for layout_code in required_layout_codes:
-        if layout_code in vk_instance.loaded_layouts: 
-            continue
-        filepath = os.path.join(vk_instance.layouts_dir, f"{layout_code}.json")
-        if os.path.exists(filepath):
-            load_single_layout_file_into_instance(vk_instance, layout_code, filepath)
-        else:
-            print(f"  - Warning: Layout file '{layout_code}.json' not found for system layout '{layout_code}'. Display will use fallback map.")
+    vk_instance.loaded_layouts = LayoutRegistry(vk_instance.layouts_dir, required_layout_codes)
+    vk_instance.loaded_layouts.start_prefetch() # Parse off-thread while the UI is being built
+    vk_instance._last_seen_sys = None # The best visual match may differ with the new set; force a full sync
+    vk_instance._default_fallback_layout = None # Recomputed on first use, so the prefetch is not joined here
+    vk_instance._label_tables = {} # Character labels were built from the previous registry
+
+
+class LayoutRegistry(Mapping):
+    """
+    Read-only mapping of layout code -> layout map that parses each JSON file on first access.
+    Iteration lists the registered codes without loading them; membership tests and lookups load
+    (and validate) the file, so a code whose file turns out to be invalid is dropped.
+    Parsed layouts are also kept in LAYOUTS_CACHE_FILE, keyed by file mtime; start_prefetch can
+    read them all on a worker thread ahead of the first lookup.
+    """
+    def __init__(self, layouts_dir: str, required_layout_codes: List[str]):
+        self.layouts_dir = layouts_dir
+        self._layouts: Dict[str, Mapping] = {} # code -> read-only view of the parsed layout
+        self._codes: List[str] = []
+        self._disk_cache = _read_layouts_cache(layouts_dir) # code -> (mtime_ns, layout)
+        self._files = _index_layout_files(layouts_dir) # code -> path; one directory scan per registry
+        self._prefetch = None # Future of {code: _read(code)} from start_prefetch, joined on first load
+        self._prefetched: Dict[str, tuple] = {}
+
+        fallback_code = next((code for code in _FALLBACK_LAYOUT_CODES if code in self._files), None)
+        if fallback_code:
+            self._codes.append(fallback_code)
+        elif not FALLBACK_CHAR_MAP:
+            print("ERROR: No fallback layout (us.json/en.json) found and FALLBACK_CHAR_MAP is empty!", file=sys.stderr)
+
+        for layout_code in required_layout_codes:
+            if layout_code in self._codes:
+                continue
+            if layout_code in self._files:
+                self._codes.append(layout_code)
+            else:
+                print(f"  - Warning: Layout file '{layout_code}.json' not found for system layout '{layout_code}'. Display will use fallback map.")
+
+    def _path(self, code: str) -> str:
+        return self._files.get(code) or os.path.join(self.layouts_dir, f"{code}.json")
+
+    def __getitem__(self, code: str) -> Mapping:
+        layout = self._layouts.get(code)
+        if layout is not None:
+            return layout
+        if code not in self._codes:
+            raise KeyError(code)
+        layout = self._load(code)
+        if layout is None:
+            self._codes.remove(code) # Invalid file; behave as if it was never registered
+            raise KeyError(code)
+        # Handed out read-only: the same map is shared by every lookup and (unwrapped) by the disk cache
+        layout = MappingProxyType(layout)
+        self._layouts[code] = layout
+        return layout
+
+    def __contains__(self, code) -> bool:
+        try:
+            self[code]
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return iter(list(self._codes))
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def start_prefetch(self):
+        """Reads and validates every registered layout on a worker thread; the first lookup waits for it."""
+        global _prefetch_executor
+        if self._prefetch is not None or not self._codes:
+            return
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="layout-prefetch")
+        codes = list(self._codes)
+        self._prefetch = _prefetch_executor.submit(lambda: {code: self._read(code) for code in codes})
+
+    def evict(self, code: str):
+        """Drops a parsed layout from memory; it is reloaded (from the disk cache) on next use."""
+        self._layouts.pop(code, None)
+
+    def _load(self, code: str) -> Optional[dict]:
+        if self._prefetch is not None:
+            self._join_prefetch()
+        mtime, layout, parsed = self._prefetched.pop(code, None) or self._read(code)
+        if parsed and layout is not None:
+            self._disk_cache[code] = (mtime, layout)
+            _write_layouts_cache(self.layouts_dir, self._disk_cache)
+        return layout
+
+    def _join_prefetch(self):
+        """Waits for start_prefetch's results and stores newly parsed layouts in the disk cache (one write)."""
+        try:
+            self._prefetched = self._prefetch.result()
+        except Exception as e:
+            print(f"Warning: Layout prefetch failed: {e}", file=sys.stderr)
+        self._prefetch = None
+        fresh = {code: (mtime, layout) for code, (mtime, layout, parsed) in self._prefetched.items() if parsed and layout is not None}
+        if fresh:
+            self._disk_cache.update(fresh)
+            _write_layouts_cache(self.layouts_dir, self._disk_cache)
+            for code in fresh:
+                self._prefetched[code] = self._prefetched[code][:2] + (False,) # Already cached
+
+    def _read(self, code: str) -> tuple:
+        """Returns (mtime_ns, layout or None, parsed); parsed is False for disk cache hits.
+        Only reads registry state, so it is safe on the prefetch worker."""
+        filepath = self._path(code)
+        try:
+            mtime = os.stat(filepath).st_mtime_ns
+        except OSError as e:
+            print(f"  - Error reading file {os.path.basename(filepath)}: {e}. Skipping.", file=sys.stderr)
+            return None, None, False
+        cached = self._disk_cache.get(code)
+        if cached and cached[0] == mtime:
+            return mtime, cached[1], False
+        print(f"Loading layout '{code}' from: {filepath}")
+        return mtime, load_layout_file(filepath), True
+
+
+def _index_layout_files(layouts_dir: str) -> Dict[str, str]:
+    """Maps layout code -> path for every .json file in layouts_dir, using a single scandir pass."""
+    files = {}
+    try:
+        with os.scandir(layouts_dir) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext == ".json" and entry.is_file():
+                    files[stem] = entry.path
+    except OSError as e:
+        print(f"Warning: Could not list layouts directory {layouts_dir}: {e}", file=sys.stderr)
+    return files
+
+
+def _read_layouts_cache(layouts_dir: str) -> Dict[str, tuple]:
+    """Returns the cached {code: (mtime_ns, layout)} entries for this layouts directory, or {}."""
+    try:
+        with open(LAYOUTS_CACHE_FILE, 'rb') as f:
+            version, cached_dir, entries = marshal.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e: # Corrupt or from an incompatible version; rebuilt on the next JSON load
+        print(f"  - Ignoring unreadable layouts cache: {e}", file=sys.stderr)
+        return {}
+    if version != _LAYOUTS_CACHE_VERSION or cached_dir != os.path.abspath(layouts_dir) or not isinstance(entries, dict):
+        return {}
+    # Keep only well-formed entries; anything else is simply re-read from its JSON file
+    return {code: entry for code, entry in entries.items()
+            if isinstance(code, str) and isinstance(entry, tuple) and len(entry) == 2
+            and isinstance(entry[0], int) and isinstance(entry[1], dict)}
+
+
+def _write_layouts_cache(layouts_dir: str, entries: Dict[str, tuple]):
+    """Stores validated layouts with their file mtimes (written atomically)."""
+    tmp_path = LAYOUTS_CACHE_FILE + ".tmp"
+    try:
+        os.makedirs(SETTINGS_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((_LAYOUTS_CACHE_VERSION, os.path.abspath(layouts_dir), entries), f)
+        os.replace(tmp_path, LAYOUTS_CACHE_FILE)
+    except Exception as e:
+        print(f"  - Could not write layouts cache: {e}", file=sys.stderr)
 
 
-def load_single_layout_file_into_instance(vk_instance, layout_code: str, filepath: str) -> bool:
-    """Loads and validates a single JSON layout file, storing it in vk_instance.loaded_layouts."""
+def load_layout_file(filepath: str) -> Optional[dict]:
+    """Loads and validates a single JSON layout file. Returns the layout map, or None if invalid."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            layout_data = json.load(f)
+        with open(filepath, 'rb') as f:
+            layout_data = _json_loads(f.read()) # Bytes in: no separate UTF-8 decode step with orjson
             if isinstance(layout_data, dict):
-                valid_structure = True
+                if _LAYOUT_VALIDATOR is not None:
+                    try:
+                        _LAYOUT_VALIDATOR(layout_data)
+                    except fastjsonschema.JsonSchemaException as e:
+                        print(f"  - Warning: Invalid data structure in {os.path.basename(filepath)} ({e.message}). Skipping file.", file=sys.stderr)
+                        return None
+                    return layout_data
                 for k, v_list in layout_data.items():
                     if not isinstance(k, str) or \
                        not isinstance(v_list, (list, tuple)) or \
@@ -109,11 +400,8 @@ def load_single_layout_file_into_instance(vk_instance, layout_code: str, filepat
                        not isinstance(v_list[0], str) or \
                        (len(v_list) == 2 and not isinstance(v_list[1], (str, type(None)))): 
                         print(f"  - Warning: Invalid data structure for key '{k}' in {os.path.basename(filepath)} (value: {v_list}). Skipping file.", file=sys.stderr)
-                        valid_structure = False
-                        break
-                if valid_structure:
-                    vk_instance.loaded_layouts[layout_code] = layout_data
-                    return True
+                        return None
+                return layout_data
             else:
                 print(f"  - Warning: Invalid format in {os.path.basename(filepath)} (expected a dictionary). Skipping.", file=sys.stderr)
     except json.JSONDecodeError as e:
@@ -122,7 +410,82 @@ def load_single_layout_file_into_instance(vk_instance, layout_code: str, filepat
         print(f"  - Error reading file {os.path.basename(filepath)}: {e}. Skipping.", file=sys.stderr)
     except Exception as e:
         print(f"  - Unexpected error loading {os.path.basename(filepath)}: {e}. Skipping.", file=sys.stderr)
-    return False
+    return None
+
+
+# --- Per-button label specs (built once per button grid, see build_label_specs) ---
+LabelSpec = namedtuple('LabelSpec', 'button kind key_name is_letter static_label index')
+(LABEL_KIND_PLAIN, LABEL_KIND_CHARMAP, LABEL_KIND_LANG,
+ LABEL_KIND_MOD_SHIFT, LABEL_KIND_MOD_CTRL, LABEL_KIND_MOD_ALT, LABEL_KIND_MOD_CAPS) = range(7)
+_LANG_KEY_OFFSETS = {'Lang1': 1, 'Lang2': 0, 'Lang3': 1} # Lang2 shows the current layout, Lang1/Lang3 the next one
+
+
+def build_label_specs(vk_instance) -> List[LabelSpec]:
+    """Classifies every button once so label refreshes only dispatch on an integer kind."""
+    specs = []
+    for key_name, button in vk_instance.buttons.items():
+        if not button: continue
+        if key_name in SHIFT_KEYS: kind = LABEL_KIND_MOD_SHIFT
+        elif key_name in CTRL_KEYS: kind = LABEL_KIND_MOD_CTRL
+        elif key_name in ALT_KEYS: kind = LABEL_KIND_MOD_ALT
+        elif key_name == 'Caps Lock': kind = LABEL_KIND_MOD_CAPS
+        elif key_name in _LANG_KEY_OFFSETS: kind = LABEL_KIND_LANG
+        elif key_name in FALLBACK_CHAR_MAP: kind = LABEL_KIND_CHARMAP
+        else: kind = LABEL_KIND_PLAIN
+        specs.append(LabelSpec(button, kind, key_name, key_name in LETTER_KEYS, KEY_DISPLAY_SYMBOLS.get(key_name, key_name), len(specs)))
+    return specs
+
+
+def _build_label_table(vk_instance, active_layout_map, fallback_map, shift_pressed: bool, letter_shifted: bool) -> List[str]:
+    """Resolves every spec's character label for one (layout, shift, caps) combination.
+    Lang keys keep their static label here; they depend on the layout cycle and are filled per refresh.
+    """
+    table = []
+    for spec in vk_instance._label_specs:
+        new_label = spec.static_label
+        if spec.kind == LABEL_KIND_CHARMAP:
+            char_tuple = active_layout_map.get(spec.key_name, fallback_map.get(spec.key_name))
+            if char_tuple and isinstance(char_tuple, (list, tuple)):
+                should_display_shifted = letter_shifted if spec.is_letter else shift_pressed
+                current_char_to_display = char_tuple[0]
+                if should_display_shifted and len(char_tuple) > 1 and char_tuple[1] is not None: 
+                    current_char_to_display = char_tuple[1]
+                if current_char_to_display is not None: 
+                    new_label = current_char_to_display
+        table.append(new_label)
+    return table
+
+
+def _lang_key_labels(vk_instance) -> Dict[str, str]:
+    """Returns the label for each Lang key from the current position in the layout cycle."""
+    # Keyed by a snapshot of the codes: the registry drops invalid codes in place as files are loaded
+    layout_codes = tuple(vk_instance.xkb_manager.get_available_layouts() if vk_instance.xkb_manager else vk_instance.loaded_layouts)
+    memo = vk_instance._lang_labels_memo
+    if memo and memo[0] == layout_codes and memo[1] == vk_instance.current_language:
+        return memo[2]
+    available_layouts = list(layout_codes)
+    if not available_layouts: available_layouts = ['us'] 
+    try:
+        current_index = available_layouts.index(vk_instance.current_language)
+    except ValueError: 
+        if vk_instance.current_language in vk_instance.loaded_layouts: 
+            current_index = 0 
+            available_layouts = [vk_instance.current_language] + [l for l in available_layouts if l != vk_instance.current_language]
+        else: 
+            current_index = 0
+            available_layouts = ['us']
+    num_layouts = len(available_layouts)
+
+    labels = {}
+    for key_name, display_idx_offset in _LANG_KEY_OFFSETS.items():
+        target_layout_to_display = "---" 
+        if display_idx_offset == 0 or num_layouts > 1:
+            target_layout_to_display = available_layouts[(current_index + display_idx_offset) % num_layouts]
+        label = target_layout_to_display.upper()
+        if len(label) > 3 and label != "---": label = label[:2]
+        labels[key_name] = label
+    vk_instance._lang_labels_memo = (layout_codes, vk_instance.current_language, labels)
+    return labels
 
 
 def update_key_labels_on_layout_change(vk_instance, specific_key_name: Optional[str] = None):
@@ -134,111 +497,58 @@ def update_key_labels_on_layout_change(vk_instance, specific_key_name: Optional[
     if not hasattr(vk_instance, 'buttons') or not vk_instance.buttons:
         return
 
-    symbol_map = {
-        "Caps Lock": "⇪ Caps", "Tab": "⇥ Tab", "Enter": "↵ Enter", "Backspace": "⌫ Bksp",
-        "Up": "↑", "Down": "↓", "Left": "←", "Right": "→",
-        "L Win": "◆", "R Win": "◆", "App": "☰", "Scroll Lock": "Scroll Lk",
-        "Pause": "Pause", "PrtSc":"PrtSc", "Insert":"Ins", "Home":"Home",
-        "Page Up":"PgUp", "Delete":"Del", "End":"End", "Page Down":"PgDn",
-        "L Ctrl":"Ctrl", "R Ctrl":"Ctrl", "L Alt":"Alt", "R Alt":"AltGr",
-        "Space":"Space", "Esc":"Esc", "About":"About", "Set":"Set",
-        "LShift": "⇧ Shift", "RShift": "⇧ Shift",
-        "Minimize":"_", "Close":"X", "Donate":"Donate"
+    if vk_instance._label_specs is None: # Reset whenever init_ui_elements rebuilds the buttons
+        vk_instance._label_specs = build_label_specs(vk_instance)
+        vk_instance._label_states = [None] * len(vk_instance._label_specs)
+        vk_instance._spec_by_name = {spec.key_name: spec for spec in vk_instance._label_specs}
+        vk_instance._label_tables = {} # Tables are indexed by spec, so they belong to one button grid
+    last_states = vk_instance._label_states # (label, toggled) last applied to each spec's button
+    spec_indices = range(len(vk_instance._label_specs))
+    if specific_key_name:
+        # Single-key refreshes always re-apply: callers (e.g. the right-click flash) changed the button directly
+        spec = vk_instance._spec_by_name.get(specific_key_name)
+        spec_indices = [spec.index] if spec else []
+        for i in spec_indices: last_states[i] = None
+
+    state = vk_instance._mod_state
+    shift_pressed = bool(state & MOD_SHIFT)
+    letter_shifted = bool((state ^ (state >> MOD_CAPS_SHIFT)) & MOD_SHIFT)
+    table_key = (vk_instance.current_language, shift_pressed, letter_shifted)
+    label_table = vk_instance._label_tables.get(table_key)
+    if label_table is None:
+        active_layout_map = vk_instance.loaded_layouts.get(vk_instance.current_language)
+        fallback_map_to_use = vk_instance.loaded_layouts.get('us',
+                                    vk_instance.loaded_layouts.get('en',
+                                        FALLBACK_CHAR_MAP if isinstance(FALLBACK_CHAR_MAP, dict) else {}
+                                    ))
+        if active_layout_map is None: 
+            active_layout_map = fallback_map_to_use
+        label_table = vk_instance._label_tables[table_key] = _build_label_table(
+            vk_instance, active_layout_map, fallback_map_to_use, shift_pressed, letter_shifted)
+
+    modifier_states = {
+        LABEL_KIND_MOD_SHIFT: shift_pressed, LABEL_KIND_MOD_CTRL: bool(state & MOD_CTRL),
+        LABEL_KIND_MOD_ALT: bool(state & MOD_ALT), LABEL_KIND_MOD_CAPS: bool(state & MOD_CAPS),
     }
-
-    active_layout_code = vk_instance.current_language
-    active_layout_map = vk_instance.loaded_layouts.get(active_layout_code)
-    fallback_map_to_use = vk_instance.loaded_layouts.get('us',
-                                vk_instance.loaded_layouts.get('en',
-                                    FALLBACK_CHAR_MAP if isinstance(FALLBACK_CHAR_MAP, dict) else {}
-                                ))
-    if active_layout_map is None: 
-        active_layout_map = fallback_map_to_use
-
-    available_layouts = vk_instance.xkb_manager.get_available_layouts() if vk_instance.xkb_manager else list(vk_instance.loaded_layouts.keys())
-    if not available_layouts: available_layouts = ['us'] 
-    num_layouts = len(available_layouts)
-    current_index = -1
-    try:
-        current_index = available_layouts.index(vk_instance.current_language)
-    except ValueError: 
-        if vk_instance.current_language in vk_instance.loaded_layouts: 
-            current_index = 0 
-            available_layouts = [vk_instance.current_language] + [l for l in available_layouts if l != vk_instance.current_language]
-            num_layouts = len(available_layouts)
-        else: 
-            current_index = 0
-            available_layouts = ['us']
-            num_layouts = 1
-
-    keys_to_process = vk_instance.buttons.items()
-    if specific_key_name and specific_key_name in vk_instance.buttons:
-        keys_to_process = [(specific_key_name, vk_instance.buttons[specific_key_name])]
-
-    for key_name, button in keys_to_process: 
-        if not button: continue 
-
-        new_label = key_name 
-        toggled = False 
-        is_modifier_visual_key = key_name in ['LShift', 'RShift', 'L Ctrl', 'R Ctrl', 'L Alt', 'R Alt', 'Caps Lock']
-
-        if key_name.startswith('Lang'):
-            target_layout_to_display = "---" 
-            display_idx_offset = 0
-
-            if key_name == 'Lang2': 
-                display_idx_offset = 0 
-            elif key_name == 'Lang1' or key_name == 'Lang3': 
-                display_idx_offset = 1
-            
-            if num_layouts > 0 and current_index != -1:
-                if (display_idx_offset == 0) or \
-                   (display_idx_offset == 1 and num_layouts > 1):
-                    actual_display_index = (current_index + display_idx_offset) % num_layouts
-                    target_layout_to_display = available_layouts[actual_display_index]
-            
-            new_label = target_layout_to_display.upper()
-            if len(new_label) > 3 and new_label != "---": new_label = new_label[:2]
-
-        elif key_name in symbol_map:
-            new_label = symbol_map[key_name]
-
-        char_tuple = active_layout_map.get(key_name, fallback_map_to_use.get(key_name))
-
-        if char_tuple and isinstance(char_tuple, (list, tuple)) and len(char_tuple) >= 1:
-            index_to_use = 0 
-            is_letter = key_name.isalpha() and len(key_name) == 1
-            should_display_shifted = (vk_instance.shift_pressed ^ vk_instance.caps_lock_pressed) if is_letter else vk_instance.shift_pressed
-
-            if should_display_shifted and len(char_tuple) > 1 and char_tuple[1] is not None: 
-                index_to_use = 1
-
-            current_char_to_display = char_tuple[index_to_use] if index_to_use < len(char_tuple) else char_tuple[0]
-            if current_char_to_display is not None: 
-                 new_label = current_char_to_display
-        elif key_name.startswith("F") and key_name[1:].isdigit(): 
-            new_label = key_name
-
-        if key_name in ['LShift', 'RShift']: toggled = vk_instance.shift_pressed
-        elif key_name in ['L Ctrl', 'R Ctrl']: toggled = vk_instance.ctrl_pressed
-        elif key_name in ['L Alt', 'R Alt']: toggled = vk_instance.alt_pressed
-        elif key_name == 'Caps Lock': toggled = vk_instance.caps_lock_pressed
-
-        if button.text() != new_label:
+    lang_labels = _lang_key_labels(vk_instance)
+
+    for i in spec_indices:
+        spec = vk_instance._label_specs[i]
+        kind = spec.kind
+        button = spec.button
+        new_label = lang_labels[spec.key_name] if kind == LABEL_KIND_LANG else label_table[i]
+
+        toggled = modifier_states.get(kind, False)
+        state = (new_label, toggled)
+        if last_states[i] == state:
+            continue # Nothing changed for this button; skip the Qt getter/setter calls
+        previous = last_states[i]
+        last_states[i] = state
+
+        if previous is None or previous[0] != new_label:
             button.setText(new_label)
-
-        if is_modifier_visual_key:
-            current_prop = button.property("modifier_on")
-            if current_prop is None or current_prop != toggled: 
-                button.setProperty("modifier_on", toggled)
-                button.style().unpolish(button)
-                button.style().polish(button)
-        else: 
-            current_prop = button.property("modifier_on")
-            if current_prop is not None and current_prop is True:
-                button.setProperty("modifier_on", False)
-                button.style().unpolish(button)
-                button.style().polish(button)
+        if previous is None or previous[1] != toggled:
+            set_modifier_visual(button, toggled)
 
 
 def update_single_key_label(vk_instance, key_name: str):
@@ -6,12 +6,11 @@
 try:
     from PyQt6.QtWidgets import QSystemTrayIcon, QMenu, QMessageBox
     from PyQt6.QtGui import QIcon, QAction, QActionGroup
-    from PyQt6.QtCore import Qt, QTimer
+    from PyQt6.QtCore import Qt, QTimer, QSignalBlocker
 except ImportError:
     print("ERROR: PyQt6 library is required for vk_tray_utils.")
     raise
 
-from .settings_manager import DEFAULT_SETTINGS
 
 def ensure_tray_icon_created(vk_instance):
     """Ensures the QSystemTrayIcon and its QMenu are created if they don't exist."""
@@ -24,6 +23,7 @@ def ensure_tray_icon_created(vk_instance):
         if vk_instance.tray_menu:
             vk_instance.tray_menu.deleteLater()
             vk_instance.tray_menu = None
+            vk_instance.tray_hide_action = None
         print("System Tray not available.")
         return False
 
@@ -57,6 +57,7 @@ def rebuild_tray_menu_content(vk_instance):
         # For simplicity, we'll re-create it.
         vk_instance.lang_action_group = None 
     vk_instance.language_actions = {}
+    vk_instance._tray_layouts = _tray_layout_list(vk_instance)
 
     # Language selection submenu
     if vk_instance.xkb_manager:
@@ -68,8 +69,8 @@ def rebuild_tray_menu_content(vk_instance):
 
             for lc_code in layouts:
                 action = QAction(lc_code, vk_instance.language_menu, checkable=True)
-                # Connect with a lambda that captures the current 'lc_code'
-                action.triggered.connect(lambda checked=False, l=lc_code: vk_instance.set_system_language_from_menu(l))
+                action.setData(lc_code) # Read back by the shared _on_language_action_triggered slot
+                action.triggered.connect(vk_instance._on_language_action_triggered)
                 vk_instance.language_menu.addAction(action)
                 vk_instance.language_actions[lc_code] = action
                 vk_instance.lang_action_group.addAction(action)
@@ -82,23 +83,18 @@ def rebuild_tray_menu_content(vk_instance):
     about_action.triggered.connect(vk_instance.show_about_message)
     settings_action = QAction("Settings...", vk_instance.tray_menu)
     settings_action.triggered.connect(vk_instance.open_settings_dialog)
-    vk_instance.tray_menu.addActions([about_action, settings_action])
-
     donate_action = QAction("Donate...", vk_instance.tray_menu)
     donate_action.triggered.connect(vk_instance._open_donate_link)
-    vk_instance.tray_menu.addAction(donate_action)
+    vk_instance.tray_menu.addActions([about_action, settings_action, donate_action]) # One call per separator-delimited group
     vk_instance.tray_menu.addSeparator()
 
     show_act = QAction("Show Keyboard", vk_instance.tray_menu)
     show_act.triggered.connect(vk_instance.show_normal_and_raise)
     
-    hide_act_text = "Hide Keyboard" 
-    if vk_instance.settings.get("auto_hide_on_middle_click", DEFAULT_SETTINGS.get("auto_hide_on_middle_click", True)):
-         hide_act_text = "Hide (Middle Mouse Click)"
-    hide_act = QAction(hide_act_text, vk_instance.tray_menu)
-    # Enable/disable based on current setting, not just default
-    hide_act.setEnabled(vk_instance.settings.get("auto_hide_on_middle_click", DEFAULT_SETTINGS.get("auto_hide_on_middle_click", True)))
+    hide_act = QAction("Hide Keyboard", vk_instance.tray_menu)
     hide_act.triggered.connect(vk_instance.hide_to_tray)
+    vk_instance.tray_hide_action = hide_act
+    update_tray_hide_action(vk_instance)
 
     vk_instance.tray_menu.addActions([show_act, hide_act])
     vk_instance.tray_menu.addSeparator()
@@ -108,11 +104,29 @@ def rebuild_tray_menu_content(vk_instance):
     vk_instance.tray_menu.addAction(quit_act)
 
 
+def _tray_layout_list(vk_instance) -> tuple:
+    """The layout list the language submenu is built from (empty without an XKB manager)."""
+    return tuple(vk_instance.xkb_manager.get_available_layouts() or ()) if vk_instance.xkb_manager else ()
+
+
+def update_tray_hide_action(vk_instance):
+    """Updates the text and enabled state of the tray 'Hide' action from current settings."""
+    hide_act = vk_instance.tray_hide_action
+    if not hide_act:
+        return
+    # Enable/disable based on current setting, not just default
+    middle_click_hides = vk_instance._auto_hide_on_middle_click
+    hide_act.setText("Hide (Middle Mouse Click)" if middle_click_hides else "Hide Keyboard")
+    hide_act.setEnabled(middle_click_hides)
+
+
 def init_or_update_tray_icon(vk_instance):
     """
     Initializes the tray icon and menu if they don't exist,
-    or updates the icon, menu content, and tooltip if they do.
+    or updates the icon, settings-dependent actions, and tooltip if they do.
+    The menu itself is only built when it is (re)created.
     """
+    menu_needs_build = vk_instance.tray_menu is None
     if not ensure_tray_icon_created(vk_instance): # This creates tray_icon and tray_menu if needed
         return
 
@@ -123,7 +137,10 @@ def init_or_update_tray_icon(vk_instance):
     except Exception as e:
         print(f"Error setting/updating tray icon image: {e}")
 
-    rebuild_tray_menu_content(vk_instance) # Always rebuild menu content for freshness
+    if menu_needs_build:
+        rebuild_tray_menu_content(vk_instance)
+    else:
+        update_tray_hide_action(vk_instance)
 
     if not vk_instance.tray_icon.isVisible():
         try:
@@ -131,32 +148,34 @@ def init_or_update_tray_icon(vk_instance):
         except Exception as e: # Can happen on some DEs if tray disappears
             print(f"Error showing tray icon: {e}")
             if vk_instance.tray_icon: vk_instance.tray_icon.deleteLater(); vk_instance.tray_icon = None
-            if vk_instance.tray_menu: vk_instance.tray_menu.deleteLater(); vk_instance.tray_menu = None
+            if vk_instance.tray_menu: vk_instance.tray_menu.deleteLater(); vk_instance.tray_menu = None; vk_instance.tray_hide_action = None
             return # Exit if showing fails critically
 
     update_tray_status_display(vk_instance) # Update tooltip and language check state
 
 
 def update_tray_status_display(vk_instance):
-    """Updates the tray icon's tooltip and the language menu's check state."""
+    """Updates the tray icon's tooltip and the language menu's check state.
+    The menu is only rebuilt when the system layout list differs from the one it was built with."""
     if not vk_instance.tray_icon or not vk_instance.tray_icon.isVisible():
         return
+    if vk_instance.tray_menu and _tray_layout_list(vk_instance) != vk_instance._tray_layouts:
+        rebuild_tray_menu_content(vk_instance)
+
+    auto_show_enabled = vk_instance._auto_show_on_edit
+    # Fixed slots, empty when not applicable; one join builds the whole tooltip
+    tooltip_parts = (
+        vk_instance.windowTitle(),
+        f"Layout: {vk_instance.xkb_manager.get_current_layout_name() or 'N/A'}" if vk_instance.xkb_manager else "",
+        "" if vk_instance.xlib_ok else "Input SIM Error",
+        "AutoShow ON" if auto_show_enabled else "",
+        "Always On Top" if vk_instance.always_on_top else "",
+    )
+    tooltip = "\n".join([part for part in tooltip_parts if part])
 
-    tooltip_parts = [vk_instance.windowTitle()]
-    if vk_instance.xkb_manager:
-        current_layout = vk_instance.xkb_manager.get_current_layout_name()
-        tooltip_parts.append(f"Layout: {current_layout or 'N/A'}")
-    if not vk_instance.xlib_ok:
-        tooltip_parts.append("Input SIM Error")
-    
-    auto_show_enabled = vk_instance.settings.get("auto_show_on_edit", DEFAULT_SETTINGS.get("auto_show_on_edit", False))
-    if auto_show_enabled:
-        tooltip_parts.append("AutoShow ON")
-    if vk_instance.always_on_top:
-        tooltip_parts.append("Always On Top")
-    
     try:
-        vk_instance.tray_icon.setToolTip("\n".join(tooltip_parts))
+        if vk_instance.tray_icon.toolTip() != tooltip: # Some trays re-render on every setToolTip
+            vk_instance.tray_icon.setToolTip(tooltip)
     except Exception as e:
         print(f"Error setting tray tooltip: {e}")
 
@@ -182,17 +201,32 @@ def update_tray_menu_language_check_state(vk_instance): # Renamed from update_tr
         return
 
     action_to_check = vk_instance.language_actions.get(current_internal_name)
-    currently_checked_action_in_group = vk_instance.lang_action_group.checkedAction()
 
-    if currently_checked_action_in_group and currently_checked_action_in_group != action_to_check:
-        currently_checked_action_in_group.blockSignals(True)
-        currently_checked_action_in_group.setChecked(False)
-        currently_checked_action_in_group.blockSignals(False)
-    
-    if action_to_check and not action_to_check.isChecked():
-        action_to_check.blockSignals(True)
-        action_to_check.setChecked(True)
-        action_to_check.blockSignals(False)
+    # Action signals are blocked, so the exclusive group never sees these changes and its checkedAction()
+    # can lag behind: uncheck whichever action is really checked, each swap in its own blocker
+    with QSignalBlocker(vk_instance.lang_action_group):
+        for checked_action in vk_instance.language_actions.values():
+            if checked_action != action_to_check and checked_action.isChecked():
+                with QSignalBlocker(checked_action): checked_action.setChecked(False)
+        if action_to_check and not action_to_check.isChecked():
+            with QSignalBlocker(action_to_check): action_to_check.setChecked(True)
+
+
+def notify(vk_instance, title, message, critical=False):
+    """Shows a non-blocking notification: a tray balloon if possible, else a non-modal message box."""
+    if vk_instance.tray_icon and vk_instance.tray_icon.isVisible() and QSystemTrayIcon.supportsMessages():
+        message_icon = QSystemTrayIcon.MessageIcon.Warning if critical else QSystemTrayIcon.MessageIcon.Information
+        try:
+            vk_instance.tray_icon.showMessage(title, message, message_icon, 3000) # milliseconds
+            return
+        except Exception as e:
+            print(f"Tray icon message display failed: {e}")
+
+    box = QMessageBox(QMessageBox.Icon.Warning if critical else QMessageBox.Icon.Information, title, message,
+                      QMessageBox.StandardButton.Ok, vk_instance)
+    box.setWindowModality(Qt.WindowModality.NonModal) # Never block the event loop (key repeat, layout sync)
+    box.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+    box.show()
 
 
 def hide_to_tray(vk_instance):
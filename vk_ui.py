@@ -4,123 +4,136 @@
 # Developed by Khaled Abdelhamid (khaled1512@gmail.com) - Licensed under GPLv3.
 
 import os
+import re
 from pathlib import Path
 try:
     from PyQt6.QtWidgets import (
         QPushButton, QSizePolicy, QMessageBox, QWidget, QGridLayout
     )
     from PyQt6.QtCore import Qt, QSize, QTimer
-    from PyQt6.QtGui import QFont, QPalette, QColor, QIcon, QPixmap, QPainter, QBrush, QPen, QCursor # Added QBrush, QPen
+    from PyQt6.QtGui import QFont, QPalette, QColor, QIcon, QPixmap, QPixmapCache, QPainter, QBrush, QPen, QCursor # Added QBrush, QPen
 except ImportError:
     print("ERROR: PyQt6 library is required for vk_ui.")
     raise
 
-from .key_definitions import KEYBOARD_LAYOUT, FALLBACK_CHAR_MAP
+from .key_definitions import KEYBOARD_GRID_TABLE, FALLBACK_CHAR_MAP, MODIFIER_KEYS
 from .settings_manager import DEFAULT_SETTINGS
 
 EDGE_NONE = 0; EDGE_TOP = 1; EDGE_BOTTOM = 2; EDGE_LEFT = 4; EDGE_RIGHT = 8
 EDGE_TOP_LEFT = EDGE_TOP | EDGE_LEFT; EDGE_TOP_RIGHT = EDGE_TOP | EDGE_RIGHT
 EDGE_BOTTOM_LEFT = EDGE_BOTTOM | EDGE_LEFT; EDGE_BOTTOM_RIGHT = EDGE_BOTTOM | EDGE_RIGHT
 
+# Resize cursor per frameless edge (see update_cursor_shape); anything else gets the arrow
+_EDGE_CURSOR_SHAPES = {
+    EDGE_TOP: Qt.CursorShape.SizeVerCursor, EDGE_BOTTOM: Qt.CursorShape.SizeVerCursor,
+    EDGE_LEFT: Qt.CursorShape.SizeHorCursor, EDGE_RIGHT: Qt.CursorShape.SizeHorCursor,
+    EDGE_TOP_LEFT: Qt.CursorShape.SizeFDiagCursor, EDGE_BOTTOM_RIGHT: Qt.CursorShape.SizeFDiagCursor,
+    EDGE_TOP_RIGHT: Qt.CursorShape.SizeBDiagCursor, EDGE_BOTTOM_LEFT: Qt.CursorShape.SizeBDiagCursor,
+}
+_ARROW_CURSOR_SHAPE = Qt.CursorShape.ArrowCursor
+
+_HEX_COLOR_RE = re.compile(r'#(?:[0-9A-Fa-f]{6}|[0-9A-Fa-f]{8})') # #RRGGBB or #AARRGGBB
+
+# Generated fallback icons, keyed by pixel size (rasterized once per process)
+_ICON_CACHE = {}
+_APP_ICON = None # Result of load_app_icon, shared by the window and the tray
+_ICON_PIXMAP_SIZES = (16, 22, 32, 48, 64)
+# Colors/brushes for the generated icon, created on first use (see _get_icon_paint_objects)
+_ICON_PAINT_OBJECTS = {}
+
+# --- Key action groups used by init_ui_elements ---
+_REPEATABLE_KEYS = frozenset(FALLBACK_CHAR_MAP) | {'Space', 'Backspace', 'Delete', 'Tab', 'Enter', 'Up', 'Down', 'Left', 'Right'}
+_NON_REPEATABLE_FUNCTIONAL_KEYS = frozenset({
+    'Esc', 'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'F10', 'F11', 'F12',
+    'PrtSc', 'Scroll Lock', 'Pause', 'Insert', 'Home', 'Page Up', 'End', 'Page Down',
+    'L Win', 'R Win', 'App'
+})
+_SPECIAL_ACTION_KEYS = frozenset({'About', 'Set', 'Minimize', 'Close', 'Donate'})
+_LANG_KEYS = frozenset({'Lang1', 'Lang2', 'Lang3'})
+_FRAME_CONTROL_KEYS = frozenset({'Minimize', 'Close'})
+
+# --- Stylesheet templates (filled with %-formatting in apply_global_styles_and_font) ---
+_COMMON_BUTTON_STYLE_TEMPLATE = "color: %s; font-family: '%s'; font-size: %spt; padding: 2px;"
+_BUTTON_STYLE_TEMPLATES = {
+    "flat": "background-color: %(button_bg)s; border: 1px solid #aaaaaa; border-radius: 3px;",
+    "gradient": "border: 1px solid #bbbbbb; "
+                "background-color: qlineargradient(x1: 0, y1: 0, x2: 0, y2: 1, stop: 0 #fefefe, stop: 1 #e0e0e0); " # Gradient uses its own bg
+                "border-radius: 4px;",
+    "default": "background-color: %(button_bg)s; border: 1px solid #C0C0C0;",
+}
+# Applied directly to a latched modifier button; overrides the inherited QPushButton rules for that button only
+_MODIFIER_ON_STYLE = "background-color: #a0cfeC; border: 1px solid #0000A0; font-weight: bold;"
+_WINDOW_STYLE_TEMPLATE = """
+        QWidget#centralWidget { background-color: %(window_bg)s !important; }
+        QPushButton { %(base_button_style)s }
+        QPushButton { color: %(text_color)s; } 
+        QPushButton:pressed { background-color: #cceeff !important; border: 1px solid #88aabb !important; }
+        QPushButton#MinimizeButton, QPushButton#CloseButton { font-weight: bold; font-size: 10pt; color: %(text_color)s; }
+        QPushButton#DonateButton { font-size: 10pt; font-weight: bold; background-color: yellow; color: black !important; border: 1px solid #A0A000; }
+    """
+
 # --- UI Initialization and Styling ---
 
 def _normalize_hex_color(color_str: str, default_color: str) -> str:
     """Validates a hex color string and returns it, or a default if invalid."""
-    if isinstance(color_str, str) and \
-       color_str.startswith('#') and \
-       (len(color_str) == 7 or len(color_str) == 9): # #RRGGBB or #AARRGGBB
-        try:
-            QColor(color_str) # Attempt to create QColor to validate fully
-            return color_str
-        except Exception:
-            # Will fall through to return default_color
-            pass 
+    if isinstance(color_str, str) and _HEX_COLOR_RE.fullmatch(color_str):
+        return color_str
     print(f"Warning: Invalid hex color string '{color_str}'. Using default '{default_color}'.")
     return default_color
 
 
 def init_ui_elements(vk_instance):
     """Initializes the UI elements (buttons) for the virtual keyboard."""
-    symbol_map = {
-        "Caps Lock": "⇪ Caps", "Tab": "⇥ Tab", "Enter": "↵ Enter", "Backspace": "⌫ Bksp",
-        "Up": "↑", "Down": "↓", "Left": "←", "Right": "→",
-        "L Win": "◆", "R Win": "◆", "App": "☰", "Scroll Lock": "Scroll Lk",
-        "Pause": "Pause", "PrtSc":"PrtSc", "Insert":"Ins", "Home":"Home",
-        "Page Up":"PgUp", "Delete":"Del", "End":"End", "Page Down":"PgDn",
-        "L Ctrl":"Ctrl", "R Ctrl":"Ctrl", "L Alt":"Alt", "R Alt":"AltGr",
-        "Space":"Space", "Esc":"Esc", "About":"About", "Set":"Set",
-        "LShift": "⇧ Shift", "RShift": "⇧ Shift",
-        "Minimize":"_", "Close":"X", "Donate":"Donate"
-    }
-    vk_instance.buttons = {} 
-
-    while vk_instance.grid_layout.count():
-        item = vk_instance.grid_layout.takeAt(0)
-        if item is not None:
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-
-    repeatable_keys = set(FALLBACK_CHAR_MAP.keys()) | {'Space', 'Backspace', 'Delete', 'Tab', 'Enter', 'Up', 'Down', 'Left', 'Right'}
-    non_repeatable_functional_keys = {
-        'Esc', 'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8', 'F9', 'F10', 'F11', 'F12',
-        'PrtSc', 'Scroll Lock', 'Pause', 'Insert', 'Home', 'Page Up', 'End', 'Page Down',
-        'L Win', 'R Win', 'App'
-    }
-    modifier_keys = {'LShift', 'RShift', 'L Ctrl', 'R Ctrl', 'L Alt', 'R Alt', 'Caps Lock'}
-    special_action_keys = {'About', 'Set', 'Minimize', 'Close', 'Donate'}
-    lang_keys = {'Lang1', 'Lang2', 'Lang3'}
-
-    for r, row_keys in enumerate(KEYBOARD_LAYOUT):
-        col = 0
-        for key_data in row_keys:
-            if key_data:
-                key_name, row_span, col_span = key_data
-                initial_label = symbol_map.get(key_name, key_name)
-                if key_name.startswith("F") and key_name[1:].isdigit():
-                    initial_label = key_name
-                elif key_name.startswith("Lang"):
-                    initial_label = "Lang" 
-
-                button = QPushButton(initial_label)
-                button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
-                button.setFocusPolicy(Qt.FocusPolicy.NoFocus)
-                button.setAutoRepeat(False) 
-
-                if key_name in special_action_keys:
-                    if key_name == 'About': button.clicked.connect(vk_instance.show_about_message)
-                    elif key_name == 'Set': button.clicked.connect(vk_instance.open_settings_dialog)
-                    elif key_name == 'Minimize': button.clicked.connect(vk_instance.hide_to_tray); button.setObjectName("MinimizeButton")
-                    elif key_name == 'Close': button.clicked.connect(vk_instance.quit_application); button.setObjectName("CloseButton")
-                    elif key_name == 'Donate': button.clicked.connect(vk_instance._open_donate_link); button.setObjectName("DonateButton")
-                elif key_name in lang_keys:
-                    button.clicked.connect(vk_instance.toggle_language)
-                elif key_name in modifier_keys:
-                    button.setProperty("modifier_on", False) 
-                    button.clicked.connect(lambda chk=False, k=key_name: vk_instance.on_modifier_key_press(k))
-                elif key_name in repeatable_keys: 
-                    button.pressed.connect(lambda k=key_name: vk_instance._handle_key_pressed(k))
-                    button.released.connect(lambda k=key_name: vk_instance._handle_key_released(k))
-                    if key_name in FALLBACK_CHAR_MAP: 
-                        button.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-                        button.customContextMenuRequested.connect(
-                            lambda pos, k=key_name: vk_instance.on_typable_key_right_press(k)
-                        )
-                elif key_name in non_repeatable_functional_keys:
-                    button.clicked.connect(lambda chk=False, k=key_name: vk_instance.on_non_repeatable_key_press(k))
-                else:
-                    print(f"Warning: Key '{key_name}' has no defined action.")
-
-
-                vk_instance.grid_layout.addWidget(button, r, col, row_span, col_span)
-                vk_instance.buttons[key_name] = button
-
-                if key_name in ['Minimize', 'Close']:
-                    button.setVisible(vk_instance.is_frameless) 
-
-                col += col_span
-            else: 
-                col += 1
+    vk_instance.buttons.clear()
+    vk_instance._frame_buttons = []
+    vk_instance._label_specs = None # Label table is rebuilt lazily for the new buttons
+
+    # Take items from the end: takeAt(0) shifts every remaining item each time
+    grid_layout = vk_instance.grid_layout
+    for i in range(grid_layout.count() - 1, -1, -1):
+        item = grid_layout.takeAt(i)
+        widget = item.widget() if item is not None else None
+        if widget is not None:
+            widget.setParent(None)
+            widget.deleteLater()
+
+    for r, col, row_span, col_span, key_name, initial_label in KEYBOARD_GRID_TABLE:
+        button = QPushButton(initial_label)
+        button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        button.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        button.setAutoRepeat(False) 
+        button.setProperty("key_name", key_name) # Read by the shared key slots via sender()
+
+        if key_name in _SPECIAL_ACTION_KEYS:
+            if key_name == 'About': button.clicked.connect(vk_instance.show_about_message)
+            elif key_name == 'Set': button.clicked.connect(vk_instance.open_settings_dialog)
+            elif key_name == 'Minimize': button.clicked.connect(vk_instance.hide_to_tray); button.setObjectName("MinimizeButton")
+            elif key_name == 'Close': button.clicked.connect(vk_instance.quit_application); button.setObjectName("CloseButton")
+            elif key_name == 'Donate': button.clicked.connect(vk_instance._open_donate_link); button.setObjectName("DonateButton")
+        elif key_name in _LANG_KEYS:
+            button.clicked.connect(vk_instance.toggle_language)
+        elif key_name in MODIFIER_KEYS:
+            button.setProperty("modifier_on", False) 
+            button.clicked.connect(vk_instance._on_modifier_button_clicked)
+        elif key_name in _REPEATABLE_KEYS: 
+            button.pressed.connect(vk_instance._on_key_button_pressed)
+            button.released.connect(vk_instance._on_key_button_released)
+            if key_name in FALLBACK_CHAR_MAP: 
+                button.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+                button.customContextMenuRequested.connect(vk_instance._on_key_button_context_menu)
+        elif key_name in _NON_REPEATABLE_FUNCTIONAL_KEYS:
+            button.clicked.connect(vk_instance._on_non_repeatable_button_clicked)
+        else:
+            print(f"Warning: Key '{key_name}' has no defined action.")
+
+
+        vk_instance.grid_layout.addWidget(button, r, col, row_span, col_span)
+        vk_instance.buttons[key_name] = button
+
+        if key_name in _FRAME_CONTROL_KEYS:
+            button.setVisible(vk_instance.is_frameless)
+            vk_instance._frame_buttons.append(button)
+
     apply_global_styles_and_font(vk_instance) 
 
 def apply_global_styles_and_font(vk_instance):
@@ -145,44 +158,12 @@ def apply_global_styles_and_font(vk_instance):
     default_btn_bg = DEFAULT_SETTINGS.get("button_background_color", "#E1E1E1")
     button_bg_color_setting = vk_instance.settings.get("button_background_color", default_btn_bg)
 
-
-    common_button_style_parts = [
-        f"color: {final_text_color_str};",
-        f"font-family: '{font_family}';",
-        f"font-size: {font_size}pt;",
-        "padding: 2px;"
-    ]
-    button_specific_style_parts = []
-    base_button_style = ""
-
-    if not use_system_colors:
-        normalized_button_bg = _normalize_hex_color(button_bg_color_setting, default_btn_bg)
-        if button_style_name == "flat":
-            button_specific_style_parts.extend([
-                f"background-color: {normalized_button_bg};",
-                "border: 1px solid #aaaaaa;", "border-radius: 3px;"
-            ])
-        elif button_style_name == "gradient":
-            button_specific_style_parts.extend([
-                "border: 1px solid #bbbbbb;",
-                "background-color: qlineargradient(x1: 0, y1: 0, x2: 0, y2: 1, stop: 0 #fefefe, stop: 1 #e0e0e0);", # Gradient uses its own bg
-                "border-radius: 4px;"
-            ])
-        else: 
-            button_specific_style_parts.append(f"background-color: {normalized_button_bg};")
-            button_specific_style_parts.append("border: 1px solid #C0C0C0;")
-        base_button_style = " ".join(common_button_style_parts + button_specific_style_parts)
-    else:
-        base_button_style = " ".join(common_button_style_parts)
-
-    toggled_modifier_style = "background-color: #a0cfeC !important; border: 1px solid #0000A0 !important; font-weight: bold;"
-    custom_control_style = f"font-weight: bold; font-size: 10pt; color: {final_text_color_str};" 
-    donate_style = "font-size: 10pt; font-weight: bold; background-color: yellow; color: black !important; border: 1px solid #A0A000;"
-
     alpha_value = int(max(0.0, min(1.0, opacity_level)) * 255)
     final_window_bg_rgba = "rgba(0,0,0,0)" 
+    normalized_button_bg = None
 
     if not use_system_colors:
+        normalized_button_bg = _normalize_hex_color(button_bg_color_setting, default_btn_bg)
         normalized_window_bg = _normalize_hex_color(window_bg_color_setting, default_win_bg)
         try:
             base_window_color = QColor(normalized_window_bg)
@@ -190,23 +171,35 @@ def apply_global_styles_and_font(vk_instance):
         except Exception as e:
             print(f"Error applying custom window background color '{normalized_window_bg}': {e}")
     else:
-        palette = vk_instance.palette()
-        base_color = palette.color(QPalette.ColorRole.Window)
-        final_window_bg_rgba = f"rgba({base_color.red()}, {base_color.green()}, {base_color.blue()}, {alpha_value})"
-
-    bg_style = f"background-color: {final_window_bg_rgba} !important;"
-    vk_instance.central_widget.setStyleSheet(f"QWidget#centralWidget {{ {bg_style} }}")
-    vk_instance.central_widget.setAutoFillBackground(True) 
-
-    full_stylesheet = f"""
-        QPushButton {{ {base_button_style} }}
-        QPushButton {{ color: {final_text_color_str}; }} 
-        QPushButton:pressed {{ background-color: #cceeff !important; border: 1px solid #88aabb !important; }}
-        QPushButton[modifier_on="true"] {{ {toggled_modifier_style} }}
-        QPushButton#MinimizeButton, QPushButton#CloseButton {{ {custom_control_style} }}
-        QPushButton#DonateButton {{ {donate_style} }}
-    """
-    vk_instance.setStyleSheet(full_stylesheet)
+        if vk_instance._base_window_rgb is None: # Reset by VirtualKeyboard.changeEvent on PaletteChange
+            base_color = vk_instance.palette().color(QPalette.ColorRole.Window)
+            vk_instance._base_window_rgb = (base_color.red(), base_color.green(), base_color.blue())
+        red, green, blue = vk_instance._base_window_rgb
+        final_window_bg_rgba = f"rgba({red}, {green}, {blue}, {alpha_value})"
+
+    # Setting a stylesheet makes Qt re-polish every button; skip it when nothing visible changed
+    style_key = (use_system_colors, final_text_color_str, button_style_name, font_family, font_size,
+                 normalized_button_bg, final_window_bg_rgba)
+    if style_key == vk_instance._last_style_key:
+        return
+    vk_instance._last_style_key = style_key
+
+    base_button_style = _COMMON_BUTTON_STYLE_TEMPLATE % (final_text_color_str, font_family, font_size)
+    if not use_system_colors:
+        button_specific_template = _BUTTON_STYLE_TEMPLATES.get(button_style_name, _BUTTON_STYLE_TEMPLATES["default"])
+        base_button_style = base_button_style + " " + (button_specific_template % {"button_bg": normalized_button_bg})
+
+    # One stylesheet (central widget background included) means one polish pass over the buttons
+    full_stylesheet = _WINDOW_STYLE_TEMPLATE % {
+        "window_bg": final_window_bg_rgba,
+        "base_button_style": base_button_style,
+        "text_color": final_text_color_str,
+    }
+    vk_instance.setUpdatesEnabled(False)
+    try:
+        vk_instance.setStyleSheet(full_stylesheet)
+    finally:
+        vk_instance.setUpdatesEnabled(True) # A single repaint once the new style is in place
 
 
 def load_initial_font_settings(vk_instance):
@@ -270,17 +263,25 @@ def center_window(vk_instance):
 
 
 def load_app_icon(vk_instance):
+    global _APP_ICON
+    if _APP_ICON is not None:
+        return _APP_ICON
+    _APP_ICON = _load_app_icon_uncached()
+    return _APP_ICON
+
+def _load_app_icon_uncached():
     icon = QIcon()
     script_dir = os.path.dirname(os.path.abspath(__file__)) 
     icon_dir = os.path.join(script_dir, 'icons')
-    icon_files = [
-        os.path.join(icon_dir, "icon_32.png"), os.path.join(icon_dir, "icon_64.png"),
-        os.path.join(icon_dir, "icon_128.png"), os.path.join(icon_dir, "icon_256.png"),
-    ]
+    try: # One directory read instead of a stat() per candidate file
+        with os.scandir(icon_dir) as entries:
+            present = {entry.name for entry in entries if entry.is_file()}
+    except OSError:
+        present = set()
     found_any = False
-    for file_path in icon_files:
-        if os.path.exists(file_path):
-            icon.addFile(file_path)
+    for file_name in ("icon_32.png", "icon_64.png", "icon_128.png", "icon_256.png"):
+        if file_name in present:
+            icon.addFile(os.path.join(icon_dir, file_name))
             found_any = True
 
     if found_any:
@@ -290,20 +291,55 @@ def load_app_icon(vk_instance):
         print("No icon files found. Generating default.")
         return generate_keyboard_icon()
 
+def _get_icon_paint_objects():
+    """Returns the cached colors/brushes used by generate_keyboard_icon."""
+    if not _ICON_PAINT_OBJECTS:
+        body_color = QColor("#ADD8E6")
+        key_color = QColor("#404040")
+        _ICON_PAINT_OBJECTS.update({
+            "body_brush": QBrush(body_color),
+            "border_color": QColor("#607B8B"),
+            "key_brush": QBrush(key_color),
+        })
+    return _ICON_PAINT_OBJECTS
+
+
 def generate_keyboard_icon(size=32):
+    cached_icon = _ICON_CACHE.get(size)
+    if cached_icon is not None:
+        return cached_icon
+
+    # Rasterize every common tray/taskbar size up front so Qt picks an exact match instead of scaling
+    icon = QIcon()
+    for pixmap_size in sorted(set(_ICON_PIXMAP_SIZES) | {size}):
+        icon.addPixmap(_get_keyboard_pixmap(pixmap_size))
+    _ICON_CACHE[size] = icon
+    return icon
+
+
+def _get_keyboard_pixmap(size):
+    """Returns the keyboard icon pixmap for size, shared through QPixmapCache."""
+    cache_key = f"pyxkeyboard_icon_{size}"
+    pixmap = QPixmapCache.find(cache_key)
+    if pixmap is None or pixmap.isNull():
+        pixmap = _render_keyboard_pixmap(size)
+        QPixmapCache.insert(cache_key, pixmap)
+    return pixmap
+
+
+def _render_keyboard_pixmap(size):
+    """Draws the fallback keyboard icon at the given pixel size."""
     pixmap = QPixmap(size, size)
     pixmap.fill(Qt.GlobalColor.transparent) 
     painter = QPainter(pixmap)
     painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
-    body_color = QColor("#ADD8E6") 
-    border_color = QColor("#607B8B") 
-    key_color = QColor("#404040")    
+    paint = _get_icon_paint_objects()
 
     body_rect_margin = int(size * 0.1)
     body_rect = pixmap.rect().adjusted(body_rect_margin, body_rect_margin, -body_rect_margin, -body_rect_margin)
-    painter.setBrush(QBrush(body_color))
-    painter.setPen(QPen(border_color, max(1, int(size * 0.05)))) 
+    painter.setBrush(paint["body_brush"])
+    painter.setPen(QPen(paint["border_color"], max(1, int(size * 0.05)))) 
     painter.drawRoundedRect(body_rect, size * 0.1, size * 0.1) 
 
     key_width_f = body_rect.width() * 0.18
@@ -314,7 +350,7 @@ def generate_keyboard_icon(size=32):
     base_x_f = body_rect.left() + key_h_spacing_f * 1.5
     base_y_f = body_rect.top() + key_v_spacing_f * 1.5
 
-    painter.setBrush(QBrush(key_color))
+    painter.setBrush(paint["key_brush"])
     painter.setPen(Qt.PenStyle.NoPen) 
 
     for r_idx in range(2): 
@@ -328,32 +364,50 @@ def generate_keyboard_icon(size=32):
     painter.drawRect(int(base_x_f), int(space_y), int(space_width), int(key_height_f))
 
     painter.end()
-    return QIcon(pixmap)
+    return pixmap
+
 
+# The update_* setters always validate/normalize the value and store it, but return early when the
+# normalized value is already stored. The settings dialog replaces vk_instance.settings wholesale with
+# raw values, so comparing the raw input would skip the validation; its own restyle covers that path.
+# Changes only schedule a restyle, so a burst of setter calls shares one stylesheet pass.
 
 def update_application_font(vk_instance, new_font):
+    if new_font == vk_instance.app_font: return
     vk_instance.app_font = QFont(new_font)
+    vk_instance._request_restyle()
 
 def update_application_opacity(vk_instance, opacity_level):
-    vk_instance.settings["window_opacity"] = max(0.0, min(1.0, opacity_level))
+    opacity_level = max(0.0, min(1.0, opacity_level))
+    if vk_instance.settings.get("window_opacity") == opacity_level: return
+    vk_instance.settings["window_opacity"] = opacity_level
+    vk_instance._request_restyle()
 
 def update_application_text_color(vk_instance, color_str):
-    default_text_color = DEFAULT_SETTINGS.get("text_color", "#000000")
-    vk_instance.settings["text_color"] = _normalize_hex_color(color_str, default_text_color)
+    color_str = _normalize_hex_color(color_str, DEFAULT_SETTINGS.get("text_color", "#000000"))
+    if vk_instance.settings.get("text_color") == color_str: return
+    vk_instance.settings["text_color"] = color_str
+    vk_instance._request_restyle()
 
 def update_window_background_color(vk_instance, color_str):
-    default_win_bg = DEFAULT_SETTINGS.get("window_background_color", "#F0F0F0")
-    vk_instance.settings["window_background_color"] = _normalize_hex_color(color_str, default_win_bg)
+    color_str = _normalize_hex_color(color_str, DEFAULT_SETTINGS.get("window_background_color", "#F0F0F0"))
+    if vk_instance.settings.get("window_background_color") == color_str: return
+    vk_instance.settings["window_background_color"] = color_str
+    vk_instance._request_restyle()
 
 def update_button_background_color(vk_instance, color_str):
-    default_btn_bg = DEFAULT_SETTINGS.get("button_background_color", "#E1E1E1")
-    vk_instance.settings["button_background_color"] = _normalize_hex_color(color_str, default_btn_bg)
+    color_str = _normalize_hex_color(color_str, DEFAULT_SETTINGS.get("button_background_color", "#E1E1E1"))
+    if vk_instance.settings.get("button_background_color") == color_str: return
+    vk_instance.settings["button_background_color"] = color_str
+    vk_instance._request_restyle()
 
 def update_application_button_style(vk_instance, style_name):
     valid_styles = ["default", "flat", "gradient"]
     if style_name not in valid_styles:
         style_name = DEFAULT_SETTINGS.get("button_style", "default")
+    if vk_instance.settings.get("button_style") == style_name: return
     vk_instance.settings["button_style"] = style_name
+    vk_instance._request_restyle()
 
 
 def get_resize_edge(vk_instance, pos):
@@ -361,34 +415,26 @@ def get_resize_edge(vk_instance, pos):
         return EDGE_NONE
     rect = vk_instance.rect()
     margin = vk_instance.resize_margin
-
-    on_top = pos.y() < margin
-    on_bottom = pos.y() > rect.bottom() - margin
-    on_left = pos.x() < margin
-    on_right = pos.x() > rect.right() - margin
-
-    edge = EDGE_NONE
-    if on_top: edge |= EDGE_TOP
-    if on_bottom: edge |= EDGE_BOTTOM
-    if on_left: edge |= EDGE_LEFT
-    if on_right: edge |= EDGE_RIGHT
-    return edge
+    x = pos.x(); y = pos.y()
+    # bool * flag is 0 or the flag, so the edge mask is built without branches
+    return (EDGE_TOP * (y < margin)
+            | EDGE_BOTTOM * (y > rect.bottom() - margin)
+            | EDGE_LEFT * (x < margin)
+            | EDGE_RIGHT * (x > rect.right() - margin))
 
 def update_cursor_shape(vk_instance, edge):
-    cursor_shape = Qt.CursorShape.ArrowCursor
-    if vk_instance.is_frameless:
-        if edge == EDGE_TOP or edge == EDGE_BOTTOM:
-            cursor_shape = Qt.CursorShape.SizeVerCursor
-        elif edge == EDGE_LEFT or edge == EDGE_RIGHT:
-            cursor_shape = Qt.CursorShape.SizeHorCursor
-        elif edge == EDGE_TOP_LEFT or edge == EDGE_BOTTOM_RIGHT:
-            cursor_shape = Qt.CursorShape.SizeFDiagCursor
-        elif edge == EDGE_TOP_RIGHT or edge == EDGE_BOTTOM_LEFT:
-            cursor_shape = Qt.CursorShape.SizeBDiagCursor
-    
-    if vk_instance.cursor().shape() != cursor_shape:
+    cursor_shape = _EDGE_CURSOR_SHAPES.get(edge, _ARROW_CURSOR_SHAPE) if vk_instance.is_frameless else _ARROW_CURSOR_SHAPE
+    if vk_instance.cursor().shape() != cursor_shape: # A QCursor is only built when the shape changes
         vk_instance.setCursor(QCursor(cursor_shape))
 
+def set_modifier_visual(button, is_on: bool):
+    """Shows or clears the latched-modifier look on a single button."""
+    if bool(button.property("modifier_on")) == is_on: # Unset property counts as off
+        return
+    button.setProperty("modifier_on", is_on)
+    button.setStyleSheet(_MODIFIER_ON_STYLE if is_on else "")
+
+
 def revert_button_flash(vk_instance, button, original_stylesheet):
     try:
         button.setStyleSheet(original_stylesheet) 
@@ -86,6 +86,60 @@ if Xlib is None:
 XK = Xlib.XK
 X = Xlib.X
 
+# --- XKB Event Subscription (python-xlib ships no XKEYBOARD extension module) ---
+_XKB_USE_CORE_KBD = 0x0100
+_XKB_NEW_KEYBOARD_NOTIFY = 0 # xkbType carried in the 'detail' byte of XKB events
+_XKB_MAP_NOTIFY = 1
+_XKB_STATE_NOTIFY = 2
+_XKB_NEW_KEYBOARD_NOTIFY_MASK = 1 << 0
+_XKB_MAP_NOTIFY_MASK = 1 << 1
+_XKB_STATE_NOTIFY_MASK = 1 << 2
+_XKB_NKN_KEYCODES_MASK = 1 << 0
+_XKB_KEYSYMS_MASK = 1 << 1 # XkbMapNotify part: key -> keysym table (what setxkbmap rewrites)
+_XKB_MODIFIER_MAP_MASK = 1 << 2
+_XKB_GROUP_STATE_MASK = 1 << 4
+# XKB-aware clients (XkbUseExtension) no longer get core MappingNotify for XKB keymap changes,
+# so the event connection selects the XKB map events explicitly
+_XKB_KEYMAP_EVENT_TYPES = frozenset({_XKB_NEW_KEYBOARD_NOTIFY, _XKB_MAP_NOTIFY})
+_XKB_STATE_GROUP_OFFSET = 9 # Effective group byte of XkbStateNotify, counted from the start of AnyEvent.data
+
+if not _is_xlib_dummy:
+    from Xlib.protocol import rq
+
+    class _XkbUseExtension(rq.ReplyRequest):
+        _request = rq.Struct(rq.Card8('opcode'),
+                             rq.Opcode(0),
+                             rq.RequestLength(),
+                             rq.Card16('wanted_major'),
+                             rq.Card16('wanted_minor'),
+                             )
+        _reply = rq.Struct(rq.Pad(1),
+                           rq.Card8('supported'),
+                           rq.Card16('sequence_number'),
+                           rq.Pad(4),
+                           rq.Card16('server_major'),
+                           rq.Card16('server_minor'),
+                           rq.Pad(20),
+                           )
+
+    class _XkbSelectEvents(rq.Request):
+        # Details hold one (affect, details) pair per selected event type in type order, except MapNotify
+        # (which uses affect_map/map): NewKeyboardNotify first, then StateNotify
+        _request = rq.Struct(rq.Card8('opcode'),
+                             rq.Opcode(1),
+                             rq.RequestLength(),
+                             rq.Card16('device_spec'),
+                             rq.Card16('affect_which'),
+                             rq.Card16('clear'),
+                             rq.Card16('select_all'),
+                             rq.Card16('affect_map'),
+                             rq.Card16('map'),
+                             rq.Card16('affect_new_keyboard'),
+                             rq.Card16('new_keyboard_details'),
+                             rq.Card16('affect_state'),
+                             rq.Card16('state_details'),
+                             )
+
 # --- Module-Level Functions ---
 
 def is_dummy():
@@ -163,6 +217,91 @@ def initialize_xlib():
         _xlib_ok = False
         return False
 
+def open_xkb_group_event_display():
+    """
+    Opens a dedicated X connection subscribed to XKB StateNotify events for keyboard
+    group (layout) changes, plus the XKB map events that signal a new keymap.
+    Returns (display, xkb_event_code) or None if unavailable.
+    """
+    if _is_xlib_dummy:
+        return None
+
+    display = None
+    try:
+        display = Xlib.display.Display()
+        ext = display.query_extension('XKEYBOARD')
+        if not ext:
+            print("XKB event subscription: XKEYBOARD extension not available.", file=sys.stderr)
+            display.close()
+            return None
+        reply = _XkbUseExtension(display=display.display, opcode=ext.major_opcode,
+                                 wanted_major=1, wanted_minor=0)
+        if not reply.supported:
+            print(f"XKB event subscription: server XKB {reply.server_major}.{reply.server_minor} not supported.", file=sys.stderr)
+            display.close()
+            return None
+        _XkbSelectEvents(display=display.display, opcode=ext.major_opcode,
+                         device_spec=_XKB_USE_CORE_KBD,
+                         affect_which=_XKB_NEW_KEYBOARD_NOTIFY_MASK | _XKB_MAP_NOTIFY_MASK | _XKB_STATE_NOTIFY_MASK,
+                         clear=0, select_all=0,
+                         affect_map=_XKB_KEYSYMS_MASK | _XKB_MODIFIER_MAP_MASK,
+                         map=_XKB_KEYSYMS_MASK | _XKB_MODIFIER_MAP_MASK,
+                         affect_new_keyboard=_XKB_NKN_KEYCODES_MASK, new_keyboard_details=_XKB_NKN_KEYCODES_MASK,
+                         affect_state=_XKB_GROUP_STATE_MASK, state_details=_XKB_GROUP_STATE_MASK)
+        display.flush()
+        return display, ext.first_event
+    except Exception as e:
+        print(f"XKB event subscription: ERROR - {e}", file=sys.stderr)
+        if display:
+            try: display.close()
+            except Exception: pass
+        return None
+
+def refresh_keyboard_mapping():
+    """ Reloads the main display's whole keymap after a keymap change seen on any connection
+        (the main display reads no events itself) and re-resolves the cached modifier keycodes.
+    """
+    global _shift_keycode, _ctrl_keycode, _alt_keycode, _caps_lock_keycode
+    if not (_xlib_ok and _display) or _is_xlib_dummy:
+        return
+    try:
+        info = _display.display.info
+        # Display.refresh_keyboard_mapping only accepts core MappingNotify events; XKB map events
+        # carry their own ranges, so reload every keycode through the same cache update it uses
+        _display._update_keymap(info.min_keycode, info.max_keycode - info.min_keycode + 1)
+        _shift_keycode = _display.keysym_to_keycode(Xlib.XK.XK_Shift_L) or _shift_keycode
+        _ctrl_keycode = _display.keysym_to_keycode(Xlib.XK.XK_Control_L) or _ctrl_keycode
+        _alt_keycode = _display.keysym_to_keycode(Xlib.XK.XK_Alt_L) or _alt_keycode
+        _caps_lock_keycode = _display.keysym_to_keycode(Xlib.XK.XK_Caps_Lock) or _caps_lock_keycode
+    except Exception as e:
+        print(f"ERROR refreshing keyboard mapping: {e}", file=sys.stderr)
+
+def drain_xkb_group_events(display, xkb_event_code):
+    """ Reads all queued events from an XKB event display.
+        Returns (connection_ok, group, keymap_changed) where group is the most recently
+        reported keyboard group (layout index), or None if no group change was queued,
+        and keymap_changed is True if the keymap changed (the main display's keymap has then
+        been reloaded, and keycode caches built from it are stale).
+    """
+    group = None
+    keymap_changed = False
+    try:
+        while display.pending_events():
+            event = display.next_event()
+            if event.type == xkb_event_code:
+                if event.detail == _XKB_STATE_NOTIFY:
+                    group = event.data[_XKB_STATE_GROUP_OFFSET]
+                elif event.detail in _XKB_KEYMAP_EVENT_TYPES:
+                    keymap_changed = True
+            elif event.type == Xlib.X.MappingNotify: # Core event, still sent for non-XKB mapping requests
+                keymap_changed = True
+    except Exception as e:
+        print(f"ERROR reading XKB events: {e}", file=sys.stderr)
+        return False, None, False
+    if keymap_changed:
+        refresh_keyboard_mapping() # Once per drained batch; setxkbmap sends several map events
+    return True, group, keymap_changed
+
 def close_xlib():
     """ Closes the Xlib display connection if it's open. """
     global _display, _xlib_ok
@@ -190,6 +329,20 @@ def send_xtest_event(event_type, keycode):
             return False
     return False
 
+def send_xtest_event_nosync(event_type, keycode):
+    """ Queues a single XTEST fake input event without syncing the connection.
+        Callers batching several events must finish with flush_display().
+        Returns True on success, False on failure.
+    """
+    if _xlib_ok and _display:
+        try:
+            Xlib.ext.xtest.fake_input(_display, event_type, keycode)
+            return True
+        except Exception as e:
+            print(f"ERROR queueing XTEST event (Type: {event_type}, KC: {keycode}): {e}", file=sys.stderr)
+            return False
+    return False
+
 def keysym_to_keycode(keysym) -> Optional[int]: # Added type hint back
     """ Converts an X11 KeySym to a KeyCode using the current display mapping.
         Returns the keycode (int) or None if not found or on error.
@@ -204,11 +357,13 @@ def keysym_to_keycode(keysym) -> Optional[int]: # Added type hint back
             return None
     return None
 
-def flush_display():
-    """ Flushes the X display connection buffer. """
+def flush_display() -> bool:
+    """ Flushes the X display connection buffer. Returns False if the flush failed. """
     if _display and not _is_xlib_dummy:
         try:
             _display.flush()
         except Exception as e:
             print(f"WARNING: Error flushing display: {e}", file=sys.stderr)
+            return False
+    return True
 # File: xlib_integration.py